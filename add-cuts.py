@@ -1,3 +1,4 @@
+#!/usr/bin/env python
 import os
 import csv
 import json
@@ -12,13 +13,11 @@ def add_cuts(cuts_left, cuts_right):
 if __name__ == '__main__':
 
   import argparse
-  import subprocess
 
   class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
     pass
 
-  __version__ = subprocess.check_output(["git", "describe", "--always"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
-  __short_hash__ = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+  from root_optimize import __version__
 
   parser = argparse.ArgumentParser(description='Left-add multiple cut files together by hash. It will use the first cut file as the list of hashes. Author: G. Stark. v.{0}'.format(__version__),
                                    formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+# @file:    engines.py
+# @purpose: Check that the engines agree, and time the subcommands on synthetic ntuples
+#
+#   python benchmarks/engines.py --events 10000 100000 --dimensions 2 3 4
+#
+# For every number of events and of dimensions, the synthetic inputs from synthetic.py are
+# made once, and then every subcommand is run in a fresh interpreter and timed (wall time).
+# The cuts are applied with every engine (the TTree::Draw path, numexpr, numba, pruning, ...)
+# and the raw, weighted and scaled counts of every hash are compared to those of the first
+# engine, within a tolerance. The results are appended to benchmarks/results.jsonl with the
+# commit they were run on, and compared to the pinned baseline in benchmarks/baseline.jsonl,
+# which only changes when a run that passed is saved to it with --update-baseline, so a slow
+# or broken run never becomes what the next ones are judged against. The exit status is 1
+# if the engines disagree or a subcommand got slower than the baseline by more than --threshold.
+#
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+
+here = os.path.dirname(os.path.abspath(__file__))
+script = os.path.join(here, os.pardir, 'optimize.py')
+results_file = os.path.join(here, 'results.jsonl')
+baseline_file = os.path.join(here, 'baseline.jsonl')
+
+def get_commit():
+  try:
+    return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=here).decode('utf-8').strip()
+  except Exception:
+    return None
+
+def run(name, args, workdir):
+  ''' run a subcommand in a fresh interpreter, returns the wall time or None if it failed '''
+  log = os.path.join(workdir, '{0:s}.log'.format(name))
+  start = time.time()
+  with open(log, 'w+') as f:
+    returncode = subprocess.call([sys.executable, script] + args, cwd=workdir, stdout=f, stderr=subprocess.STDOUT)
+  elapsed = time.time() - start
+  # the command line logs exceptions instead of raising them
+  with open(log) as f:
+    failed = returncode != 0 or 'An exception was caught!' in f.read()
+  if failed:
+    print('\t{0:s} failed, see {1:s}'.format(name, log))
+    return None
+  return elapsed
+
+# the engines to apply the cuts with, as (name, arguments), the first one that runs is the reference
+engines = [('cut-root', []),
+           ('cut-numpy', ['--numpy']),
+           ('cut-numpy-no-jit', ['--numpy', '--no-jit']),
+           ('cut-numpy-prune', ['--numpy', '--prune']),
+           ('cut-numpy-downcast', ['--numpy', '--downcast']),
+           ('cut-numpy-fold', ['--numpy', '--fold-scale-factor']),
+           ('cut-numpy-threads', ['--numpy', '--backend', 'threads'])]
+
+def get_cases(args, inputs):
+  ''' the subcommands to time, as (name, arguments, output directory of the cuts or None), in the order they have to run in '''
+  ntuples, supercuts, weights, mass_windows = inputs
+  common = ['--supercuts', supercuts, '--weightsFile', weights, '--ncores', str(args.ncores), '--hide-subtasks']
+  cases = []
+  for name, options in engines:
+    if args.skip_root and name == 'cut-root': continue
+    output = name.replace('-', '_')
+    cases.append((name, ['cut'] + ntuples + common + options + ['-o', output], output))
+  # the significances are computed from the cuts of the reference
+  reference = cases[0][2]
+  signal = ['{0:s}.json'.format(did) for did, is_signal, m_gluino, m_stop, m_lsp in synthetic.samples if is_signal]
+  bkgd = ['{0:s}.json'.format(did) for did, is_signal, m_gluino, m_stop, m_lsp in synthetic.samples if not is_signal]
+  cases.append(('optimize', ['optimize', '--signal'] + signal + ['--bkgd'] + bkgd + ['--searchDirectory', reference, '-o', 'significances'], None))
+  cases.append(('optimize-best-first', ['optimize', '--signal'] + signal + ['--bkgd'] + bkgd + ['--searchDirectory', reference, '-o', 'significances_best', '--best-first', '--supercuts', supercuts], None))
+  cases.append(('summary', ['summary', '--searchDirectory', 'significances', '--massWindows', mass_windows, '--output', 'summary.json'], None))
+  cases.append(('hash', ['hash', '--use-summary', 'summary.json', '--supercuts', supercuts, '-o', 'hashes'], None))
+  return cases
+
+def load_counts(directory):
+  ''' the counts of every DID written out by the cuts, by DID then hash '''
+  counts = {}
+  for filename in glob.glob(os.path.join(directory, '*.json')):
+    with open(filename) as f:
+      counts[os.path.basename(filename)[:-len('.json')]] = json.load(f)
+  return counts
+
+def get_mismatches(reference, counts, rtol, atol):
+  ''' the (did, hash, problem) of every count that is missing or differs from the reference by more than the tolerance '''
+  mismatches = []
+  for did in sorted(set(reference) | set(counts)):
+    if did not in counts or did not in reference:
+      mismatches.append((did, None, 'missing DID'))
+      continue
+    for cut_hash in sorted(set(reference[did]) | set(counts[did])):
+      if cut_hash not in counts[did] or cut_hash not in reference[did]:
+        mismatches.append((did, cut_hash, 'missing hash'))
+        continue
+      for counts_type in ['raw', 'weighted', 'scaled']:
+        expected, actual = reference[did][cut_hash][counts_type], counts[did][cut_hash][counts_type]
+        if abs(actual - expected) > atol + rtol*abs(expected):
+          mismatches.append((did, cut_hash, '{0:s} {1:g} != {2:g}'.format(counts_type, actual, expected)))
+  return mismatches
+
+def check_engines(cases, timings, workdir, rtol, atol):
+  ''' compare the counts of every engine that ran to the first one, returns the number of engines that disagree '''
+  outputs = [(name, output) for name, case, output in cases if output is not None and timings[name] is not None]
+  if len(outputs) < 2: return 0
+  reference_name, reference_output = outputs[0]
+  reference = load_counts(os.path.join(workdir, reference_output))
+  numFailed = 0
+  for name, output in outputs[1:]:
+    mismatches = get_mismatches(reference, load_counts(os.path.join(workdir, output)), rtol, atol)
+    if not mismatches: continue
+    numFailed += 1
+    print('\t{0:s} disagrees with {1:s} on {2:d} counts, for example:'.format(name, reference_name, len(mismatches)))
+    for did, cut_hash, problem in mismatches[:5]:
+      print('\t\t{0:s} {1:s}: {2:s}'.format(did, cut_hash or '', problem))
+  if not numFailed: print('\t{0:d} engines agree with {1:s}'.format(len(outputs)-1, reference_name))
+  return numFailed
+
+def get_baseline(filename, settings):
+  ''' the pinned result in filename with the same settings, None if there is none '''
+  if not os.path.exists(filename): return None
+  baseline = None
+  with open(filename) as f:
+    for line in f:
+      entry = json.loads(line)
+      if entry['settings'] == settings: baseline = entry
+  return baseline
+
+def update_baseline(filename, result):
+  ''' pin the result as the baseline for its settings, replacing the one pinned before '''
+  entries = []
+  if os.path.exists(filename):
+    with open(filename) as f:
+      entries = [json.loads(line) for line in f]
+  entries = [entry for entry in entries if entry['settings'] != result['settings']] + [result]
+  with open(filename, 'w+') as f:
+    for entry in entries: f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+def compare(result, baseline, threshold, min_time):
+  ''' print how the result compares to the baseline, returns the number of subcommands that got slower by more than threshold '''
+  if baseline is None: return 0
+  print('\tcompared to {0:s} ({1:s}):'.format(baseline['commit'], baseline['date']))
+  numRegressions = 0
+  for name, elapsed in sorted(result['timings'].items()):
+    before = baseline['timings'].get(name)
+    if elapsed is None or before is None: continue
+    # very short runs are dominated by the start up and too noisy to flag
+    regression = elapsed > before*(1. + threshold) and elapsed - before > min_time
+    numRegressions += regression
+    print('\t\t{0:20s} {1:8.3f}s -> {2:8.3f}s ({3:+0.1%}){4:s}'.format(name, before, elapsed, elapsed/before - 1, ' SLOWER' if regression else ''))
+  return numRegressions
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Time the cut, optimize, summary and hash subcommands on synthetic ntuples.')
+  parser.add_argument('--events', type=int, nargs='+', default=[10000, 100000], help='numbers of events in every ntuple')
+  parser.add_argument('--dimensions', type=int, nargs='+', default=[2, 3, 4], help='numbers of supercuts')
+  parser.add_argument('--pivots', type=int, default=10, help='number of pivots of every supercut')
+  parser.add_argument('--ncores', type=int, default=1, help='number of cores for the cuts')
+  parser.add_argument('--skip-root', action='store_true', help='do not run the cuts without --numpy, which can take a long time')
+  parser.add_argument('--rtol', type=float, default=1e-4, help='relative tolerance of the counts of the engines (the weights are summed in single or double precision)')
+  parser.add_argument('--atol', type=float, default=1e-6, help='absolute tolerance of the counts of the engines')
+  parser.add_argument('--baseline', type=str, default=baseline_file, help='pinned results to compare the timings to, the one with the same settings is used')
+  parser.add_argument('--update-baseline', action='store_true', help='pin the results of this run as the baseline for their settings, if every subcommand ran and the engines agree')
+  parser.add_argument('--threshold', type=float, default=0.2, help='flag a subcommand as slower if it takes more than this fraction longer than the baseline')
+  parser.add_argument('--min-time', type=float, default=0.5, help='do not flag a subcommand as slower if it takes fewer than this many more seconds than the baseline')
+  parser.add_argument('--no-save', action='store_true', help='do not append the results to {0:s}'.format(os.path.basename(results_file)))
+  parser.add_argument('--keep', action='store_true', help='keep the working directories')
+  args = parser.parse_args()
+
+  commit = get_commit()
+  numFailed = 0
+  for numEvents in args.events:
+    for numDimensions in args.dimensions:
+      workdir = tempfile.mkdtemp(prefix='rooptimize_bench_')
+      print('{0:d} events, {1:d} dimensions ({2:s})'.format(numEvents, numDimensions, workdir))
+      inputs = synthetic.make_inputs(workdir, numEvents, numDimensions, args.pivots)
+      cases = get_cases(args, inputs)
+      timings = {}
+      for name, case, output in cases:
+        timings[name] = run(name, case, workdir)
+        if timings[name] is not None: print('\t{0:20s} {1:8.3f}s'.format(name, timings[name]))
+      numBroken = sum(timing is None for timing in timings.values())
+      numBroken += check_engines(cases, timings, workdir, args.rtol, args.atol)
+      result = {'commit': commit,
+                'date': datetime.datetime.now().isoformat(),
+                'host': platform.node(),
+                'python': platform.python_version(),
+                'settings': {'events': numEvents, 'dimensions': numDimensions, 'pivots': args.pivots, 'ncores': args.ncores},
+                'timings': timings}
+      numRegressions = compare(result, get_baseline(args.baseline, result['settings']), args.threshold, args.min_time)
+      result.update(failed=numBroken, regressions=numRegressions)
+      numFailed += numBroken + numRegressions
+      if not args.no_save:
+        with open(results_file, 'a') as f:
+          f.write(json.dumps(result, sort_keys=True) + '\n')
+      # a slower run can be pinned on purpose (eg: for a change that trades speed for something else), a broken one never
+      if args.update_baseline and numBroken:
+        print('\tnot updating the baseline, some subcommands failed or the engines disagree')
+      elif args.update_baseline:
+        update_baseline(args.baseline, result)
+        print('\tpinned as the baseline in {0:s}'.format(args.baseline))
+      if not args.keep: shutil.rmtree(workdir)
+  sys.exit(1 if numFailed else 0)
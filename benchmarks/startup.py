@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+# @file:    startup.py
+# @purpose: Time how long the command line takes to start up
+#
+#   python benchmarks/startup.py [-n 10]
+#
+# Every command is run in a fresh interpreter, so this includes the imports. The heavy
+# modules that got imported along the way are listed next to the time, none of the
+# subcommands here should need ROOT or root_numpy.
+#
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+script = os.path.join(here, os.pardir, 'optimize.py')
+heavy_modules = ['ROOT', 'root_numpy', 'joblib', 'numba', 'scipy']
+
+commands = [('import root_optimize', ['-c', 'import root_optimize']),
+            ('import root_optimize.command_line', ['-c', 'import root_optimize.command_line']),
+            ('optimize.py --help', [script, '--help']),
+            ('optimize.py hash --help', [script, 'hash', '--help']),
+            ('optimize.py optimize --help', [script, 'optimize', '--help'])]
+
+def get_imported(args):
+  ''' which of the heavy modules running args imports '''
+  code = ("import sys, atexit\n"
+          "atexit.register(lambda: sys.__stderr__.write(' '.join(m for m in {0!r} if m in sys.modules)))\n"
+          "sys.argv = {1!r}\n"
+          "source = sys.argv[1] if sys.argv[0] == '-c' else open(sys.argv[0]).read()\n"
+          "exec(compile(source, sys.argv[0], 'exec'), {{'__name__': '__main__'}})\n").format(heavy_modules, args)
+  process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  stdout, stderr = process.communicate()
+  return stderr.decode('utf-8', 'replace').strip().split('\n')[-1]
+
+def time_command(args, repeat):
+  timings = []
+  for i in range(repeat):
+    start = time.time()
+    subprocess.call([sys.executable] + args, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    timings.append(time.time() - start)
+  return sorted(timings)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Time how long the command line takes to start up.')
+  parser.add_argument('-n', '--repeat', type=int, default=5, help='how many times to run each command')
+  args = parser.parse_args()
+
+  print('{0:40s} {1:>8s} {2:>8s}   {3:s}'.format('command', 'min [s]', 'median', 'imports'))
+  for name, command in commands:
+    timings = time_command(command, args.repeat)
+    print('{0:40s} {1:8.3f} {2:8.3f}   {3:s}'.format(name, timings[0], timings[len(timings)//2], get_imported(command)))
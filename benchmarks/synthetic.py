@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+# @file:    synthetic.py
+# @purpose: Make synthetic optimization ntuples, supercuts and weights to benchmark with
+#
+#   python benchmarks/synthetic.py -o bench --events 100000 --dimensions 3
+#
+# The events are drawn from simple, seeded distributions for the branches in boundaries.json,
+# so the same arguments always give the same files. Nothing here is meant to look like physics,
+# only to make the cuts do a realistic amount of work.
+#
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+boundaries_file = os.path.join(here, os.pardir, 'boundaries.json')
+
+# the order the branches are added to the supercuts in, the multiplicities are integers
+branches = ['met', 'm_effective', 'multiplicity_jet', 'multiplicity_jet_b', 'mTb', 'm_transverse', 'multiplicity_topTag_veryloose']
+multiplicities = ['multiplicity_jet', 'multiplicity_jet_b', 'multiplicity_topTag_veryloose']
+
+# (did, is signal, gluino mass, stop mass, lsp mass) of the samples that are made
+samples = [('370100', True, 1400, 5000, 1),
+           ('370101', True, 1800, 5000, 1),
+           ('410000', False, 0, 0, 0),
+           ('410001', False, 0, 0, 0)]
+
+def make_events(numEvents, seed, signal=False):
+  ''' a structured array with every branch of boundaries.json and the event weight, signal is harder '''
+  rng = np.random.RandomState(seed)
+  hardness = 2. if signal else 1.
+  dtype = [('event_weight', np.float32)] + [(branch, np.int32 if branch in multiplicities else np.float32) for branch in branches]
+  arr = np.zeros(numEvents, dtype=dtype)
+  arr['event_weight'] = rng.normal(1., 0.1, numEvents)
+  arr['met'] = rng.exponential(150.*hardness, numEvents)
+  arr['multiplicity_jet'] = rng.poisson(4.*hardness, numEvents)
+  arr['multiplicity_jet_b'] = rng.binomial(arr['multiplicity_jet'], 0.3)
+  arr['multiplicity_topTag_veryloose'] = rng.binomial(np.minimum(arr['multiplicity_jet'], 5), 0.1*hardness)
+  arr['m_effective'] = arr['met'] + rng.gamma(arr['multiplicity_jet'] + 1., 80.*hardness)
+  arr['mTb'] = rng.exponential(120.*hardness, numEvents)
+  arr['m_transverse'] = rng.exponential(100.*hardness, numEvents)
+  return arr
+
+def make_supercuts(numDimensions, numPivots):
+  ''' supercuts on the first numDimensions branches, each with about numPivots pivots spread over the range in boundaries.json '''
+  boundaries = json.load(open(boundaries_file))
+  supercuts = []
+  for branch in branches[:numDimensions]:
+    start, stop, numBins = boundaries[branch]
+    if branch in multiplicities:
+      # a pivot per multiplicity
+      st3 = [0, min(int(stop), numPivots), 1]
+    else:
+      stop = start + (stop - start)/2.
+      st3 = [start, stop, (stop - start)/numPivots]
+    supercuts.append({'selections': '{0:s} >= {{0}}'.format(branch) if branch in multiplicities else '{0:s} > {{0}}'.format(branch),
+                      'st3': [st3]})
+  return supercuts
+
+def make_weights(numEvents):
+  weights = {}
+  for did, signal, m_gluino, m_stop, m_lsp in samples:
+    weights[did] = {'cross section': 0.1 if signal else 10., 'errors': [], 'filter efficiency': 1.0, 'k-factor': 1.0, 'num events': float(numEvents), 'rel uncert': 0.1}
+  return weights
+
+def write_ntuple(filename, arr, tree_name='oTree'):
+  import root_numpy as rnp
+  rnp.array2root(arr, filename, treename=tree_name, mode='recreate')
+
+def make_inputs(directory, numEvents, numDimensions, numPivots, seed=0):
+  ''' write the ntuples, supercuts, weights and mass windows for a benchmark to directory
+        - returns the filenames of the ntuples, the supercuts, the weights and the mass windows
+  '''
+  if not os.path.exists(directory): os.makedirs(directory)
+  ntuples = []
+  for index, (did, signal, m_gluino, m_stop, m_lsp) in enumerate(samples):
+    filename = os.path.join(directory, '{0:s}.bench.root'.format(did))
+    write_ntuple(filename, make_events(numEvents, seed + index, signal))
+    ntuples.append(filename)
+
+  supercuts = os.path.join(directory, 'supercuts_{0:d}d.json'.format(numDimensions))
+  with open(supercuts, 'w+') as f:
+    f.write(json.dumps(make_supercuts(numDimensions, numPivots), indent=2))
+  weights = os.path.join(directory, 'weights.json')
+  with open(weights, 'w+') as f:
+    f.write(json.dumps(make_weights(numEvents), indent=2, sort_keys=True))
+  mass_windows = os.path.join(directory, 'mass_windows.txt')
+  with open(mass_windows, 'w+') as f:
+    f.write(''.join('{0:s}\t{1:d}\t{2:d}\t{3:d}\n'.format(did, m_gluino, m_stop, m_lsp) for did, signal, m_gluino, m_stop, m_lsp in samples if signal))
+  return ntuples, supercuts, weights, mass_windows
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Make synthetic optimization ntuples, supercuts and weights to benchmark with.')
+  parser.add_argument('-o', '--output', type=str, default='bench', help='directory to write everything to')
+  parser.add_argument('--events', type=int, default=100000, help='number of events in every ntuple')
+  parser.add_argument('--dimensions', type=int, default=3, help='number of supercuts (at most {0:d})'.format(len(branches)))
+  parser.add_argument('--pivots', type=int, default=10, help='number of pivots of every supercut')
+  parser.add_argument('--seed', type=int, default=0, help='seed of the first sample, the others use the next ones')
+  args = parser.parse_args()
+  ntuples, supercuts, weights, mass_windows = make_inputs(args.output, args.events, args.dimensions, args.pivots, args.seed)
+  for filename in ntuples + [supercuts, weights, mass_windows]:
+    print(filename)
@@ -17,10 +17,13 @@ tree_name = 'oTree'
 eventWeightBranch = 'event_number'
 files = glob.glob("TA02_MBJ13V4-6/ttbarExc_0L/fetch/data-optimizationTree/*407012*.root")
 
+# the chain is the same for every region, so only make it once
+chain = get_ttree(tree_name, files, eventWeightBranch)
+
 for region in regions:
     supercuts = json.load(file(region))
 
-    tree = get_ttree(tree_name, files, eventWeightBranch)
+    tree = chain
     branchesSpecified = list(set(itertools.chain.from_iterable(selection_to_branches(supercut['selections'], tree) for supercut in supercuts)))
     eventWeightBranchesSpecified = list(set(selection_to_branches(eventWeightBranch, tree)))
 
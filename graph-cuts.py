@@ -1,4 +1,6 @@
+#!/usr/bin/env python
 from root_optimize import plotting
+from root_optimize.grid import CutGrid
 import os
 import csv
 import json
@@ -103,13 +105,11 @@ def exclusion():
 
 if __name__ == '__main__':
   import argparse
-  import subprocess
 
   class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
     pass
 
-  __version__ = subprocess.check_output(["git", "describe", "--always"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
-  __short_hash__ = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+  from root_optimize import __version__
 
   parser = argparse.ArgumentParser(description='Author: A. Cukierman, G. Stark. v.{0}'.format(__version__),
                                    formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
@@ -157,8 +157,9 @@ if __name__ == '__main__':
   with open(args.supercuts) as f:
     supercuts = json.load(f)
 
+  grid = CutGrid(supercuts)
   i = 0
-  for supercut in supercuts:
+  for supercut, axis in zip(supercuts, grid.axes):
     if supercut.get('pivot') is not None: continue
     cut = supercut['selections']
     # a cut string can have multiple pivots, need to draw a histogram for each pivot subsection
@@ -184,8 +185,9 @@ if __name__ == '__main__':
           hist.SetBinContent(b, 0.001)
 
       st3 = supercut['st3'][pivotIndex]
-      # number of steps
-      steps = np.arange(st3[0], st3[1]+st3[2], st3[2])
+      # number of steps, the pivots of the grid along this range and one more step to close the last bin
+      pivots = grid.dimensions[axis[pivotIndex]]
+      steps = np.append(pivots, pivots[-1]+st3[2])
       nSteps = len(steps)-1
       hist.GetZaxis().SetRangeUser(steps[0], steps[-1])
       hist.GetZaxis().CenterLabels()
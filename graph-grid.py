@@ -1,15 +1,14 @@
+#!/usr/bin/env python
 from root_optimize import plotting
 import os
 
 if __name__ == '__main__':
   import argparse
-  import subprocess
 
   class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
     pass
 
-  __version__ = subprocess.check_output(["git", "describe", "--always"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
-  __short_hash__ = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+  from root_optimize import __version__
 
   parser = argparse.ArgumentParser(description='Author: A. Cukierman, G. Stark. v.{0}'.format(__version__),
                                    formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
@@ -7,10 +7,7 @@ __version__ = '0.5.1'
 __all__ = ['json_encoder',
            'utils']
 
-# Set up ROOT
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
-ROOT.gROOT.SetBatch(True)
+# ROOT is imported (and set up in batch mode) by `lazy` the first time it is used
 
 import logging
 from .utils import TqdmLoggingHandler
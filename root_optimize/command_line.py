@@ -26,7 +26,7 @@ import operator
 import glob
 import os
 import sys
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import tempfile
 import tqdm
 
@@ -35,21 +35,55 @@ from . import utils
 from .json import NoIndent, NoIndentEncoder
 
 # parallelization (http://blog.dominodatalab.com/simple-parallelization/)
-from joblib import Parallel, delayed, load, dump
+#   joblib is imported by the subcommands that use it, so the others start up quickly
 import multiprocessing
 
+def setup_profile(args):
+  ''' make the directory that --profile writes the profiles to '''
+  if args.profile is None: return
+  if not os.path.exists(args.profile): os.makedirs(args.profile)
+
+def report_profile(profiles, directory):
+  ''' merge the profiles of the jobs and log where the merged profile and its hot functions are '''
+  from root_optimize import timing
+  merged = os.path.join(directory, 'merged.prof')
+  report = timing.merge_profiles(profiles, merged)
+  if report is None:
+    logger.warning("None of the jobs were profiled")
+    return
+  logger.log(25, "Merged the profiles of {0:d} jobs into {1:s}, the hottest functions are in {2:s}".format(len(profiles), merged, report))
+
 #@echo(write=logger.debug)
 def do_cuts(args):
-  from root_optimize.timing import secondsToStr
-
-  # before doing anything, let's ensure the directory we make is ok
-  if not os.path.exists(args.output_directory):
-    os.makedirs(args.output_directory)
-  elif args.overwrite:
-    import shutil
-    shutil.rmtree(args.output_directory)
-  else:
-    raise IOError("Output directory already exists: {0:s}".format(args.output_directory))
+  from root_optimize import timing
+  from joblib import Parallel, delayed
+
+  # before doing anything, let's ensure the directory we make is ok (a plan does not write anything)
+  if not args.plan:
+    if not os.path.exists(args.output_directory):
+      os.makedirs(args.output_directory)
+    elif args.overwrite:
+      import shutil
+      shutil.rmtree(args.output_directory)
+    else:
+      raise IOError("Output directory already exists: {0:s}".format(args.output_directory))
+    setup_profile(args)
+  # an engine overrides --numpy and --no-jit
+  if args.engine not in (None, 'auto'):
+    args.numpy, args.jit = args.engine != 'root', args.engine == 'numba'
+  # TTree::Draw draws on a canvas of ROOT shared by every thread
+  if args.backend == 'threads' and args.engine != 'auto' and not args.plan and not args.numpy:
+    raise ValueError('The thread backend only works with the numpy or numba engines. Pass in --numpy as well.')
+
+  # read the entries and branches of every file once, and keep them for the next runs
+  #   (scheduling the DIDs needs the entries of every file, which would otherwise mean opening all of them every run)
+  #   the output directory is new on every run, so the index is kept wherever ROOPTIMIZE_INDEX says instead
+  if args.index is None and not args.plan:
+    from .index import environment_variable
+    args.index = os.environ.get(environment_variable)
+  if args.index is not None:
+    from .index import use_index
+    use_index(args.index, args.files, args.tree_name, min(multiprocessing.cpu_count(), args.num_cores))
 
   # first step is to group by the sample DID
   dids = defaultdict(list)
@@ -59,14 +93,53 @@ def do_cuts(args):
   # load in the supercuts file
   supercuts = utils.read_supercuts_file(args.supercuts)
 
+  # parse the selections and make sure every branch they use exists, before any of the workers start
+  from .selection import get_branches
+  try:
+    branches = get_branches(supercuts, args.eventWeightBranch)
+  except SyntaxError:
+    # ROOT understands a lot more than python does (eg: `Sum$(x)`), so only numexpr needs them to parse
+    if args.numpy: raise
+    logger.warning("Could not parse all of the selections, not checking the branches they use")
+    branches = []
+  for did, files in dids.items():
+    missing = utils.get_missing_branches(args.tree_name, files[0], branches)
+    if missing:
+      raise ValueError('The branches {0:s} used in the supercuts do not exist in {1:s} (DID {2:s})'.format(', '.join(missing), files[0], did))
+
   # load up the weights file
   if not os.path.isfile(args.weightsFile):
     raise ValueError('The supplied weights file `{0}` does not exist or I cannot find it.'.format(args.weightsFile))
   else:
-    weights = json.load(file(args.weightsFile))
+    with open(args.weightsFile, 'r') as f:
+      weights = json.load(f)
 
   # parallelize
   num_cores = min(multiprocessing.cpu_count(), args.num_cores)
+  report = args.report or '{0:s}.timing.json'.format(os.path.normpath(args.output_directory))
+
+  from .grid import CutGrid
+  numCuts = len(CutGrid(supercuts))
+  # estimate what the run takes with every engine from the headers of the files, before any events are read in
+  if args.plan or args.engine == 'auto':
+    from .plan import get_available_memory, make_plan, print_plan, recommend
+    plans = make_plan(dids, args.tree_name, branches, numCuts, num_cores, args.backend, report)
+    # numexpr and numba need to parse the selections
+    if not branches:
+      logger.warning("Could not parse the selections, only TTree::Draw can apply them")
+      plans = [plan for plan in plans if plan['engine'] == 'root']
+    if args.backend == 'threads':
+      plans = [plan for plan in plans if plan['engine'] != 'root']
+      if not plans: raise ValueError('The thread backend only works with the numpy or numba engines, which need to parse the selections.')
+    budget = get_available_memory()
+    if args.max_memory is not None: budget = min(budget or float('inf'), args.max_memory*1024**3)
+    best = recommend(plans, budget)
+    if args.plan:
+      print_plan(plans, best, budget)
+      return
+    logger.log(25, "Picked the {0:s} engine on {1:d} cores{2:s}".format(best['engine'], best['cores'], ', splitting the DIDs' if best['split'] else ''))
+    args.numpy, args.jit = best['engine'] != 'root', best['engine'] == 'numba'
+    num_cores, args.split_dids = best['cores'], best['split']
   logger.log(25, "Using {0} cores".format(num_cores) )
 
   pids = None
@@ -75,7 +148,49 @@ def do_cuts(args):
     from numpy import memmap, uint64
     pids = memmap(os.path.join(tempfile.mkdtemp(), 'pids'), dtype=uint64, shape=num_cores, mode='w+')
 
-  overall_progress = tqdm.tqdm(total=len(dids), desc='Num. files', position=0, leave=True, unit='file', dynamic_ncols=True)
+  # estimate how long every DID takes, so the largest ones are started first and none is left for last
+  from .schedule import get_costs, get_jobs, get_job_cost, schedule
+  costs = get_costs(dids, args.tree_name, numCuts)
+  jobs = get_jobs(dids, costs, numCuts, num_cores, args.split_dids)
+
+  # keep the jobs running at once under the memory budget, splitting the grid of a DID further if it takes more than its share
+  governor = None
+  if args.max_memory is not None:
+    from .plan import get_engine, get_footprint, get_row_size
+    from .schedule import fit_jobs
+    budget = args.max_memory*1024**3
+    engine = get_engine(args.numpy, args.jit)
+    rowSizes = dict((did, get_row_size(args.tree_name, files[0], branches)) for did, files in dids.items())
+    footprint = lambda job: get_footprint(engine, utils.get_entries(args.tree_name, job[1]), rowSizes[job[0]], numCuts if job[2] is None else job[2][1]-job[2][0])
+    jobs = fit_jobs(jobs, footprint, budget, numCuts, num_cores)
+    footprints = dict((utils.get_job_name(did, shard), footprint((did, files, shard))) for did, files, shard in jobs)
+    if max(footprints.values()) > budget:
+      logger.warning("The largest job needs {0:0.1f} GB, more than --max-memory, it will run by itself".format(max(footprints.values())/1024.**3))
+    governor = utils.MemoryGovernor(budget, footprints, args.backend == 'processes')
+    logger.log(25, "Keeping the jobs under {0:0.1f} GB, the largest needs {1:0.1f} GB".format(args.max_memory, max(footprints.values())/1024.**3))
+  if len(jobs) > len(dids):
+    logger.log(25, "Split {0:d} DIDs into {1:d} jobs".format(len(dids), len(jobs)))
+  workers, work = schedule(jobs, costs, numCuts, num_cores)
+  logger.log(25, "Busiest core has {0:0.2%} more than an equal share of the work".format(max(work)*float(num_cores)/max(sum(work), 1) - 1))
+
+  # with prefetching, every worker gets a list of jobs and reads in the next one while it cuts the current one
+  #   (the chains and the skim of TTree::Draw cannot be set up on one thread while the cuts are drawn on another)
+  if args.prefetch and not args.numpy:
+    raise ValueError('Prefetching the DIDs only works with the numpy or numba engines. Pass in --numpy as well, or leave out --prefetch.')
+  if args.prefetch is None: args.prefetch = args.numpy
+  chunks = None
+  if args.profile is not None and args.prefetch:
+    logger.log(25, "Not prefetching the DIDs, so that reading them in shows up in the profiles")
+  if args.prefetch and args.profile is None and len(jobs) > num_cores:
+    chunks = [worker for worker in workers if worker]
+  else:
+    # joblib hands the next job to whichever core is free, so the largest jobs go first
+    jobs = sorted(jobs, key=lambda job: get_job_cost(job, costs, numCuts), reverse=True)
+
+  if chunks is None:
+    overall_progress = tqdm.tqdm(total=len(jobs), desc='Num. jobs', position=0, leave=True, unit='job', dynamic_ncols=True)
+  else:
+    overall_progress = tqdm.tqdm(total=len(chunks), desc='Num. workers', position=0, leave=True, unit='worker', dynamic_ncols=True)
   class CallBack(object):
     completed = defaultdict(int)
 
@@ -93,14 +208,79 @@ def do_cuts(args):
   import joblib.parallel
   joblib.parallel.CallBack = CallBack
 
-  results = Parallel(n_jobs=num_cores)(delayed(utils.do_cut)(did, files, supercuts, weights, args.tree_name, args.output_directory, args.eventWeightBranch, args.numpy, pids) for did, files in dids.items())
+  # pruning only works on the numpy arrays
+  if args.prune and not args.numpy:
+    raise ValueError('Pruning the cuts requires the numpy optimization. Pass in --numpy as well.')
+  prune_below = args.prune_below if args.prune else None
+  # recording a background as empty would make the cuts look more significant than they are
+  if prune_below is not None and prune_below > 1:
+    if not args.signal_dids:
+      raise ValueError('--prune-below above 1 only makes sense for signal samples. Pass in their DIDs with --signal-dids.')
+    unknown = sorted(set(args.signal_dids) - set(dids))
+    if unknown: logger.warning("The signal DIDs {0:s} are not in the files".format(', '.join(unknown)))
+
+  # the thread backend shares one ROOT, the weights and the arrays between its workers
+  shared = None
+  if args.backend == 'threads':
+    utils.enable_thread_safety()
+    # the shards of a DID are cut from the same array
+    if args.numpy: shared = utils.SharedTrees(jobs)
+  # the workers and the threads of numexpr in them should use every core once
+  numexpr_threads = utils.get_numexpr_threads(num_cores, args.backend)
+  logger.log(25, "Using {0:d} {1:s} with {2:d} numexpr threads each".format(num_cores, args.backend, numexpr_threads))
+  utils.ne.set_num_threads(numexpr_threads)
+  # new worker processes pick this up when they import numexpr, the ones joblib kept around are handed it with every job
+  os.environ['NUMEXPR_NUM_THREADS'] = str(numexpr_threads)
+  backend = 'threading' if args.backend == 'threads' else None
+
+  # the workers send their progress to the parent, which writes it out every so often
+  monitor, reporter = None, None
+  if args.metrics is not None:
+    from .metrics import Monitor
+    monitor = Monitor(args.metrics, len(jobs), sum(numCuts if shard is None else shard[1]-shard[0] for did, files, shard in jobs),
+                      args.metrics_interval, args.backend == 'processes', {'output': os.path.normpath(args.output_directory)})
+    reporter = monitor.reporter()
+    logger.log(25, "Writing the progress to {0:s} every {1:g} seconds".format(args.metrics, args.metrics_interval))
+
+  start = timing.wall_clock()
+
+  if chunks is None:
+    job_results = Parallel(n_jobs=num_cores, backend=backend)(delayed(utils.do_cut)(did, files, supercuts, weights, args.tree_name, args.output_directory, args.eventWeightBranch, args.numpy, pids, prune_below, args.sparse_below, args.jit, args.fold_scale_factor, args.downcast, shard, shared, args.profile, reporter, governor, args.signal_dids, args.index, numexpr_threads) for did, files, shard in jobs)
+  else:
+    chunk_results = Parallel(n_jobs=num_cores, backend=backend)(delayed(utils.do_cut_prefetched)(chunk, supercuts, weights, args.tree_name, args.output_directory, args.eventWeightBranch, args.numpy, pids, prune_below, args.sparse_below, args.jit, args.fold_scale_factor, args.downcast, shared, reporter, governor, args.signal_dids, args.index, numexpr_threads) for chunk in chunks)
+    jobs = sum(chunks, [])
+    job_results = sum(chunk_results, [])
 
   overall_progress.close()
+  if monitor is not None: monitor.close()
+  if governor is not None: governor.shutdown()
+
+  # put the results of the jobs back together for every DID, in the order of the DIDs
+  shards = defaultdict(list)
+  did_results = {}
+  for (did, files, shard), (result, timer) in zip(jobs, job_results):
+    if shard is not None: shards[did].append(shard)
+    if did not in did_results:
+      did_results[did] = (result, timer)
+    else:
+      did_results[did] = (did_results[did][0] and result, did_results[did][1].merge(timer))
+  for did in shards:
+    if did_results[did][0]: utils.merge_shards(args.output_directory, did, sorted(shards[did]))
+  results = [did_results[did] for did in dids]
 
   for did, result in zip(dids, results):
     logger.log(25, 'DID {0:s}: {1:s}'.format(did, 'ok' if result[0] else 'not ok'))
 
-  logger.log(25, "Total CPU elapsed time: {0}".format(secondsToStr(sum(result[1] for result in results))))
+  if args.profile is not None:
+    profiles = [utils.get_profile_filename(args.profile, did, shard) for did, files, shard in jobs]
+    report_profile(profiles, args.profile)
+
+  timers = [timer for result, timer in results]
+  from .plan import get_engine
+  report = timing.write_report(report, timers, backend=args.backend, num_cores=num_cores, numexpr_threads=numexpr_threads, numpy=args.numpy, engine=get_engine(args.numpy, args.jit),
+                               num_cuts=numCuts, elapsed=timing.wall_clock()-start, failed=[did for did, result in zip(dids, results) if not result[0]])
+  logger.log(25, "Total CPU elapsed time: {0}".format(timing.secondsToStr(report['cpu'])))
+  logger.log(25, "Elapsed time: {0} ({1:0.2%} of the time spent by the jobs went into reading the files)".format(timing.secondsToStr(report['elapsed']), report['io_wall']/max(report['wall'], 1e-9)))
 
   return True
 
@@ -112,13 +292,17 @@ def do_optimize(args):
     os.makedirs(args.output_directory)
   else:
     raise IOError("Output directory already exists: {0:s}".format(args.output_directory))
+  setup_profile(args)
+  from root_optimize import timing
 
   rescale = None
   did_to_group = None
   if args.rescale:
-    rescale = json.load(file(args.rescale))
+    with open(args.rescale, 'r') as f:
+      rescale = json.load(f)
     if args.did_to_group is None: raise ValueError('If you are going to rescale, you need to pass in the --did-to-group mapping dict.')
-    did_to_group = json.load(file(args.did_to_group))
+    with open(args.did_to_group, 'r') as f:
+      did_to_group = json.load(f)
 
   logger.log(25, 'Reading in all background files to calculate total background')
 
@@ -157,13 +341,31 @@ def do_optimize(args):
   del duplicate_log_filter
 
   # create hash for background
-  bkgdHash = hashlib.md5(str(sorted(bkgd_dids))).hexdigest()
+  bkgdHash = hashlib.md5(str(sorted(bkgd_dids)).encode('utf-8')).hexdigest()
   logger.log(25, "List of backgrounds produces hash: {0:s}".format(bkgdHash))
   # write the backgrounds to a file
   with open(os.path.join(args.output_directory, '{0:s}.json'.format(bkgdHash)), 'w+') as f:
     f.write(json.dumps(sorted(bkgd_dids)))
 
+  def get_sig_dict(cuthash, counts_dict):
+    return dict([('hash', cuthash)] + [('significance_{0:s}'.format(counts_type), utils.get_significance(args.lumi*1000*counts, args.lumi*1000*total_bkgd[cuthash][counts_type], args.insignificanceThreshold, args.bkgdUncertainty, args.bkgdStatUncertainty, total_bkgd[cuthash]['raw'], args.significance)) for counts_type, counts in counts_dict.items()] + [('yield_{0:s}'.format(counts_type), {'sig': args.lumi*1000*counts, 'bkg': args.lumi*1000*total_bkgd[cuthash][counts_type]}) for counts_type, counts in counts_dict.items()])
+
+  # bounds the scaled significance of a region given the most signal and the least background it can have
+  def get_upper_bound(sig_counts, bkgd_counts):
+    signal = args.lumi*1000*sig_counts['scaled']
+    # the insignificant cuts are flagged as -1, -2, -3
+    if signal < args.insignificanceThreshold: return -1
+    bkgd = max(args.lumi*1000*bkgd_counts['scaled'], args.insignificanceThreshold)
+    return max(-1, utils.get_significance(signal, bkgd, args.insignificanceThreshold, args.bkgdUncertainty, args.bkgdStatUncertainty, float('inf'), args.significance))
+
+  supercuts = None
+  if args.best_first:
+    if args.supercuts is None: raise ValueError('If you are going to use --best-first, you need to pass in the --supercuts used to make the cuts.')
+    from .search import find_top_cuts
+    supercuts = utils.read_supercuts_file(args.supercuts)
+
   logger.log(25, "Calculating significance for each signal file")
+  profiles = []
   # for each signal file, open, read, load, and divide with the current background
   for signal in args.signal:
     # expand out patterns if needed
@@ -171,16 +373,21 @@ def do_optimize(args):
       did = utils.get_did(fname)
       logger.log(25, '\tCalculating significances for {0:s} ({1:s})'.format(did, fname))
       significances = []
-      with open(fname, 'r') as f:
-        signal_data = json.load(f)
-        for cuthash, counts_dict in signal_data.items():
-          sig_dict = dict([('hash', cuthash)] + [('significance_{0:s}'.format(counts_type), utils.get_significance(args.lumi*1000*counts, args.lumi*1000*total_bkgd[cuthash][counts_type], args.insignificanceThreshold, args.bkgdUncertainty, args.bkgdStatUncertainty, total_bkgd[cuthash]['raw'])) for counts_type, counts in counts_dict.items()] + [('yield_{0:s}'.format(counts_type), {'sig': args.lumi*1000*counts, 'bkg': args.lumi*1000*total_bkgd[cuthash][counts_type]}) for counts_type, counts in counts_dict.items()])
-          significances.append(sig_dict)
+      profiles.append(utils.get_profile_filename(args.profile, 'optimize_{0:s}'.format(did)))
+      with timing.profile(profiles[-1]), open(fname, 'r') as f:
+        signal_data = json.load(f, object_pairs_hook=OrderedDict)
+        if supercuts is not None:
+          significances = find_top_cuts(supercuts, signal_data, total_bkgd, get_upper_bound, get_sig_dict, args.max_num_hashes)
+        else:
+          for cuthash, counts_dict in signal_data.items():
+            significances.append(get_sig_dict(cuthash, counts_dict))
       logger.log(25, '\t\tCalculated significances for {0:d} cuts'.format(len(significances)))
       # at this point, we have a list of significances that we can dump to a file
       with open(os.path.join(args.output_directory, 's{0:s}.b{1:s}.json'.format(did, bkgdHash)), 'w+') as f:
         f.write(json.dumps(sorted(significances, key=operator.itemgetter('significance_scaled'), reverse=True)[:args.max_num_hashes], sort_keys=True, indent=4))
 
+  if args.profile is not None: report_profile(profiles, args.profile)
+
   return True
 
 #@echo(write=logger.debug)
@@ -188,11 +395,22 @@ def do_generate(args):
   if os.path.isfile(args.output_filename):
     raise IOError("Output file already exists: {0}".format(args.output_filename))
 
-  # this is a dict that holds the tree
-  tree = utils.get_ttree(args.tree_name, [args.file], args.eventWeightBranch)
+  # the branches are in the index, if there is one
+  metadata = None
+  if args.index is not None:
+    from .index import use_index
+    metadata = use_index(args.index, [args.file], args.tree_name).get(args.file, args.tree_name)
 
   # list of branches to loop over
-  branches=[i.GetName() for i in tree.GetListOfBranches() if not i.GetName() == args.eventWeightBranch]
+  if metadata is not None:
+    for ewBranch in utils.selection_to_branches(args.eventWeightBranch, None):
+      if not ewBranch in metadata['branches']:
+        raise ValueError('The event weight branch does not exist: {0}'.format(ewBranch))
+    branches=[b for b in metadata['branches'] if not b == args.eventWeightBranch]
+  else:
+    # this is a dict that holds the tree
+    tree = utils.get_ttree(args.tree_name, [args.file], args.eventWeightBranch)
+    branches=[i.GetName() for i in tree.GetListOfBranches() if not i.GetName() == args.eventWeightBranch]
 
   supercuts = []
 
@@ -230,14 +448,17 @@ def do_hash(args):
   hash_values = args.hash_values
   if args.use_summary:
     logger.info("Treating hash_values as containing only a summary.json file instead")
-    hash_values = set([r['hash'] for r in json.load(file(args.hash_values[0]))])
+    with open(args.hash_values[0], 'r') as f:
+      hash_values = set([r['hash'] for r in json.load(f)])
 
   logger.info("Finding cuts for {0:d} hashes.".format(len(hash_values)))
   # now loop over all cuts until we find all the hashes
-  for cut in utils.get_cut(copy.deepcopy(data)):
-    cut_hash = utils.get_cut_hash(cut)
+  from .grid import CutGrid
+  grid = CutGrid(data)
+  for index, cut_hash in enumerate(grid.iter_hashes()):
     logger.info("\tChecking {0:s}".format(cut_hash))
     if cut_hash in hash_values:
+      cut = grid.get_cut(index)
       with open(os.path.join(args.output_directory, "{0}.json".format(cut_hash)), 'w+') as f:
         f.write(json.dumps([{k: (NoIndent(v) if k == 'pivot' else v)  for k, v in d.items() if k in ['selections', 'pivot', 'fixed']} for d in cut], sort_keys=True, indent=4, cls=NoIndentEncoder))
       hash_values.remove(cut_hash)
@@ -257,6 +478,7 @@ def do_summary(args):
   mass_windows = utils.load_mass_windows(args.mass_windows)
   num_cores = min(multiprocessing.cpu_count(),args.num_cores)
   logger.log(25, "Using {0} cores".format(num_cores) )
+  from joblib import Parallel, delayed
   results = Parallel(n_jobs=num_cores)(delayed(utils.get_summary)(filename, mass_windows, args.stop_masses) for filename in glob.glob(os.path.join(args.search_directory, "s*.b*.json")))
   results = [_f for _f in results if _f]
   logger.log(25, "Generated summary for {0} items".format(len(results)))
@@ -308,6 +530,7 @@ def main():
   parallel_parser = argparse.ArgumentParser(add_help=False, formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
   rescale_parser = argparse.ArgumentParser(add_help=False, formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
   did_to_group_parser = argparse.ArgumentParser(add_help=False, formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
+  profile_parser = argparse.ArgumentParser(add_help=False, formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
 
   # general arguments for all
   main_parser.add_argument('-v','--verbose', dest='verbose', action='count', default=0, help='Enable verbose output of various levels.')
@@ -319,10 +542,13 @@ def main():
   supercuts_parser.add_argument('--supercuts', required=False, type=str, dest='supercuts', metavar='<file.json>', help='json dict of supercuts to generate optimization cuts to apply', default='supercuts.json')
   # these are options allowing for various additional configurations in filtering container and types to dump in the trees
   tree_parser.add_argument('--tree', type=str, required=False, dest='tree_name', metavar='<tree name>', help='name of the tree containing the ntuples', default='oTree')
+  tree_parser.add_argument('--index', type=str, required=False, dest='index', metavar='<file.json>', help='json index of the entries, branches and branch types of the tree in every file. Files that are not in it (or changed since) are read in parallel and added to it, the rest are never opened just to find these out. Scheduling the cuts needs the entries of every file, so without an index that is a full pass over the headers of all of the files on every run. For cut, defaults to the file in the ROOPTIMIZE_INDEX environment variable, if it is set (except with --plan).', default=None)
   tree_parser.add_argument('--eventWeight', type=str, required=False, dest='eventWeightBranch', metavar='<branch name>', help='name of event weight branch in the ntuples. It must exist.', default='event_weight')
 
   parallel_parser.add_argument('--ncores', type=int, required=False, dest='num_cores', metavar='<n>', help='Number of cores to use for parallelization. Defaults to max.', default=multiprocessing.cpu_count())
 
+  profile_parser.add_argument('--profile', required=False, type=str, dest='profile', metavar='<directory>', help='Run every DID under cProfile, write the profiles to this directory and merge them into merged.prof and a report of the hottest functions (merged.txt).', default=None)
+
   rescale_parser.add_argument('--rescale', required=False, type=str, dest='rescale', metavar='<file.json>', help='json dict of groups and dids to apply a scale factor to. If not provided, no scaling will be done.', default=None)
 
   did_to_group_parser.add_argument('--did-to-group', required=False, type=str, dest='did_to_group', metavar='<file.json>', help='json dict mapping a did to a group.', default=None)
@@ -342,7 +568,7 @@ def main():
   generate_parser.add_argument('--skipBranches', type=str, nargs='+', required=False, dest='skip_branches', metavar='<branch>', help='branches that should be skipped. can use wildcards', default=[])
 
   # needs: files, tree, eventWeight, supercuts, parallel
-  cuts_parser = subparsers.add_parser("cut", parents=[main_parser, files_parser, tree_parser, supercuts_parser, parallel_parser],
+  cuts_parser = subparsers.add_parser("cut", parents=[main_parser, files_parser, tree_parser, supercuts_parser, parallel_parser, profile_parser],
                                       description='Process ROOT ntuples and apply cuts. v.{0}'.format(__version__),
                                       usage='%(prog)s <file.root> ... [options]', help='Apply the cuts',
                                       formatter_class=lambda prog: CustomFormatter(prog, max_help_position=50),
@@ -351,11 +577,28 @@ def main():
   cuts_parser.add_argument('-o', '--output', required=False, type=str, dest='output_directory', metavar='<directory>', help='output directory to store the <hash>.json files', default='cuts')
   cuts_parser.add_argument('-f', '--overwrite', required=False, action='store_true', help='If flagged, will remove the output directory before creating it, if it already exists')
   cuts_parser.add_argument('--numpy', required=False, action='store_true', help='Enable numpy optimization to speed up the cuts processing')
+  cuts_parser.add_argument('--downcast', required=False, action='store_true', help='With --numpy, store every branch in the narrowest type that does not change any of the cuts (eg: int8 for multiplicities) to save memory.')
+  cuts_parser.add_argument('--fold-scale-factor', required=False, action='store_true', dest='fold_scale_factor', help='With --numpy, multiply the event weights by the scale factor of the sample once, so the scaled counts come straight out of the cuts.')
+  cuts_parser.add_argument('--no-jit', required=False, action='store_false', dest='jit', help='With --numpy, do not compile the cuts with numba even if it is installed.')
+  cuts_parser.add_argument('--report', required=False, type=str, dest='report', metavar='<file.json>', help='Where to write the time spent in each phase of every DID, the event and cut rates and the peak memory. Defaults to <output>.timing.json next to the output directory.', default=None)
+  cuts_parser.add_argument('--backend', required=False, type=str, choices=['processes', 'threads'], dest='backend', metavar='<backend>', help='Run the workers as processes, or as threads of this process that share ROOT and the arrays they read in (numexpr and numba run without the GIL). Threads need --numpy, TTree::Draw cannot run in several threads at once.', default='processes')
+  cuts_parser.add_argument('--split-dids', required=False, action='store_true', dest='split_dids', help='Split a DID with more than an equal share of the work of each core into shards of the cuts, applied by different cores.')
+  cuts_parser.add_argument('--max-memory', required=False, type=float, dest='max_memory', metavar='<GB>', help='Keep the estimated memory of the jobs running at once under this many GB: a job waits for memory to free up before it reads in its DID, and a DID that takes more than its share of the memory of each core has its cuts split into smaller shards.', default=None)
+  cuts_parser.add_argument('--prefetch', required=False, action='store_true', dest='prefetch', help='Read in the next DID on a background thread while the current one is being cut. This is the default with --numpy, and does not work without it since ROOT cannot draw from two threads at once.', default=None)
+  cuts_parser.add_argument('--no-prefetch', required=False, action='store_false', dest='prefetch', help='Do not read in the next DID on a background thread while the current one is being cut.', default=None)
+  cuts_parser.add_argument('--engine', required=False, type=str, choices=['numba', 'numpy', 'root', 'auto'], dest='engine', metavar='<engine>', help='Apply the cuts with numba, numexpr (numpy) or TTree::Draw (root), instead of going by --numpy and --no-jit. With auto, the engine, the number of cores and --split-dids are picked by the estimates of --plan.', default=None)
+  cuts_parser.add_argument('--plan', required=False, action='store_true', help='Do not apply any cuts. Estimate the runtime, memory and output size with every engine and number of cores from the entries and branch types in the headers of the files, recommend one, and exit.')
+  cuts_parser.add_argument('--prune', required=False, action='store_true', help='Enable branch-and-bound pruning of the cuts. Once a cut keeps too few raw events, every tighter cut is recorded as empty without being evaluated. Requires --numpy.')
+  cuts_parser.add_argument('--prune-below', required=False, type=int, dest='prune_below', metavar='<raw events>', help='With --prune, stop evaluating once a cut of a --signal-dids DID keeps fewer than this many raw events. The default only prunes cuts that are already empty, which gives the same raw counts as a full scan and the same weighted counts up to floating point rounding.', default=1)
+  cuts_parser.add_argument('--signal-dids', required=False, type=str, nargs='+', dest='signal_dids', metavar='<DID>', help='The DIDs of the signal samples. --prune-below above 1 only applies to these, the other DIDs are only pruned where a cut is empty, so no background is recorded as smaller than it is.', default=None)
+  cuts_parser.add_argument('--sparse-below', required=False, type=float, dest='sparse_below', metavar='<fraction>', help='With --prune, once a cut keeps less than this fraction of the events, only the events it keeps are looked at by the cuts applied on top of it.', default=0.05)
+  cuts_parser.add_argument('--metrics', required=False, type=str, dest='metrics', metavar='<file>', help='Periodically write the progress of the run (cuts and jobs done, cut and event rates, ETA, memory of every worker) to this file, as JSON or in the Prometheus text format if it ends with .prom.', default=None)
+  cuts_parser.add_argument('--metrics-interval', required=False, type=float, dest='metrics_interval', metavar='<seconds>', help='How often to write out --metrics.', default=10.)
   cuts_parser.add_argument('--hide-subtasks', action='store_true', help='Enable to hide the subtask progress on cuts. This might be if you get annoyed by how buggy it is.')
 
 
   # needs: signal, bkgd, bkgdUncertainty, insignificanceThreshold, tree, eventWeight
-  optimize_parser = subparsers.add_parser("optimize", parents=[main_parser, rescale_parser, did_to_group_parser],
+  optimize_parser = subparsers.add_parser("optimize", parents=[main_parser, rescale_parser, did_to_group_parser, profile_parser],
                                           description='Process ROOT ntuples and Optimize Cuts. v.{0}'.format(__version__),
                                           usage='%(prog)s  --signal={DID1}.json {DID2}.json [..] --bkgd={DID3}.json {DID4}.json {DID5}.json [...] [options]', help='Calculate significances for a series of computed cuts',
                                           formatter_class=lambda prog: CustomFormatter(prog, max_help_position=50),
@@ -369,6 +612,9 @@ def main():
   optimize_parser.add_argument('--lumi', type=float, required=False, dest='lumi', metavar='<scaled lumi>', help='Apply a global luminosity factor (units are ifb)', default=1.0)
   optimize_parser.add_argument('-o', '--output', required=False, type=str, dest='output_directory', metavar='<directory>', help='output directory to store the <hash>.json files', default='significances')
   optimize_parser.add_argument('-n', '--max-num-hashes', required=False, type=int, metavar='<n>', help='Maximum number of hashes to print for each significance file', default=25)
+  optimize_parser.add_argument('--significance', required=False, type=str, choices=['root', 'scipy'], dest='significance', metavar='<method>', help='Compute the significance (BinomialExpZ) with ROOT, or with scipy which does not need to import ROOT.', default='root')
+  optimize_parser.add_argument('--best-first', required=False, action='store_true', help='Only find the top --max-num-hashes cuts with a best-first search over the cuts of --supercuts, skipping the cuts that cannot make it. Assumes the event weights are not negative.')
+  optimize_parser.add_argument('--supercuts', required=False, type=str, dest='supercuts', metavar='<file.json>', help='json dict of supercuts used to generate the cuts. Needed for --best-first.', default=None)
 
   # needs: supercuts
   hash_parser = subparsers.add_parser("hash", parents=[main_parser, supercuts_parser],
@@ -408,6 +654,7 @@ def main():
   try:
     # start execution of actual program
     from root_optimize import timing
+    timing.start()
 
     # set verbosity for python printing
     if args.verbose < 5:
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import copy
+import hashlib
+import itertools
+import operator
+from functools import reduce
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+# what every engine fills in for each cut of the grid
+counts_dtype = [('raw', np.float64), ('weighted', np.float64), ('pruned', np.bool_)]
+
+class CutGrid(object):
+  ''' The grid of cuts generated by a list of supercuts, in the same order as `utils.get_cut`
+        - every range in a `st3` is a dimension of the grid, holding its pivot values as a numpy array
+        - a cut is just an index into the grid, so the grid can be counted, walked in blocks of indices
+          and sliced into shards without building anything per cut
+        - `get_cut` fills in the pivots of the supercuts for a cut, and like `utils.get_cut` returns
+          the same list every time, so compute what you need (eg: the hash) right away
+
+      Slicing a grid (`grid[start:stop]`) gives a shard, indices are always relative to the start of the shard.
+  '''
+  def __init__(self, supercuts):
+    self.supercuts = copy.deepcopy(supercuts)
+    self.dimensions = []
+    # the dimensions belonging to each supercut, fixed supercuts have none
+    self.axes = []
+    for supercut in self.supercuts:
+      if 'st3' in supercut:
+        self.axes.append(list(range(len(self.dimensions), len(self.dimensions)+len(supercut['st3']))))
+        self.dimensions.extend(np.arange(*st3) for st3 in supercut['st3'])
+        supercut['fixed'] = False
+      else:
+        self.axes.append([])
+        supercut['fixed'] = True
+    self.shape = tuple(dimension.size for dimension in self.dimensions)
+    # the number of pivots of each supercut, and how many cuts apart two neighbouring pivots are
+    self.sizes = [reduce(operator.mul, (self.shape[dimension] for dimension in axis), 1) for axis in self.axes]
+    self.strides = [reduce(operator.mul, self.sizes[index+1:], 1) for index in range(len(self.sizes))]
+    self.start = 0
+    self.stop = reduce(operator.mul, self.sizes, 1)
+    self._parts = None
+
+  def __len__(self):
+    return self.stop - self.start
+
+  def __getitem__(self, index):
+    if not isinstance(index, slice): return self.get_cut(index)
+    start, stop, step = index.indices(len(self))
+    if step != 1: raise ValueError('A shard of the grid has to be contiguous.')
+    shard = copy.copy(self)
+    # each shard fills in its own supercuts
+    shard.supercuts = copy.deepcopy(self.supercuts)
+    shard.start, shard.stop = self.start+start, self.start+max(start, stop)
+    return shard
+
+  def split(self, numShards):
+    ''' split the grid into (at most) numShards contiguous shards of about the same size '''
+    bounds = [len(self)*shard//numShards for shard in range(numShards+1)]
+    return [self[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+  def get_positions(self, indices):
+    ''' position of the cuts at these indices along every dimension (works on arrays of indices too) '''
+    return np.unravel_index(np.asarray(indices) + self.start, self.shape) if self.shape else ()
+
+  def get_locals(self, indices):
+    ''' which pivot of every supercut the cuts at these indices use (works on arrays of indices too) '''
+    indices = np.asarray(indices) + self.start
+    return [(indices//stride) % size for size, stride in zip(self.sizes, self.strides)]
+
+  def get_pivots(self, indices):
+    ''' pivot values along every dimension for the cuts at these indices (works on arrays of indices too) '''
+    return [dimension[position] for dimension, position in zip(self.dimensions, self.get_positions(indices))]
+
+  def get_index(self, pivots):
+    ''' the index of the cut with these pivot values along every dimension, the inverse of `get_pivots` '''
+    positions = []
+    for dimension, values in zip(self.dimensions, pivots):
+      values = np.asarray(values)
+      order = np.argsort(dimension, kind='mergesort')
+      position = order[np.minimum(np.searchsorted(dimension[order], values), dimension.size-1)]
+      if np.any(dimension[position] != values): raise KeyError('{0} is not on the grid'.format(values))
+      positions.append(position)
+    index = np.ravel_multi_index(positions, self.shape) - self.start if self.shape else 0 - self.start
+    if np.any(index < 0) or np.any(index >= len(self)): raise KeyError('{0} is not in this shard of the grid'.format(pivots))
+    return index
+
+  def iter_blocks(self, block_size=1 << 16):
+    ''' walk the grid in blocks, yields (start, stop) and the indices of the cuts in between '''
+    for start in range(0, len(self), block_size):
+      stop = min(start+block_size, len(self))
+      yield start, stop, np.arange(start, stop)
+
+  def get_cut(self, index):
+    ''' fill in the pivots of the supercuts for the cut at this index and return them '''
+    positions = self.get_positions(index)
+    for supercut, axis in zip(self.supercuts, self.axes):
+      if axis: supercut['pivot'] = tuple(self.dimensions[dimension][positions[dimension]] for dimension in axis)
+    return self.supercuts
+
+  def iter_cuts(self):
+    ''' same as `utils.get_cut`, but only over the cuts of this shard '''
+    for index in range(len(self)): yield self.get_cut(index)
+
+  def get_parts(self):
+    ''' `utils.get_cut_hash` hashes a string with one part per supercut, which only depends on its own pivot
+          - so every part is only built once, for every pivot of every supercut
+    '''
+    if self._parts is None:
+      self._parts = []
+      for supercut, axis in zip(copy.deepcopy(self.supercuts), self.axes):
+        parts = []
+        for pivot in itertools.product(*(self.dimensions[dimension] for dimension in axis)):
+          if axis: supercut['pivot'] = pivot
+          parts.append(str(sorted(supercut.items())))
+        self._parts.append(parts)
+    return self._parts
+
+  def get_hash(self, index):
+    ''' the same as `utils.get_cut_hash` of the cut at this index '''
+    return next(self.iter_hashes(np.array([index])))
+
+  def iter_hashes(self, indices=None, block_size=1 << 16):
+    ''' yields the hash of every cut in the grid (or of the given indices), in order '''
+    parts = self.get_parts()
+    blocks = self.iter_blocks(block_size) if indices is None else [(None, None, np.asarray(indices))]
+    for start, stop, block in blocks:
+      for local in zip(*(pivot.tolist() for pivot in self.get_locals(block))) if parts else [()]*block.size:
+        yield hashlib.md5('[{0:s}]'.format(', '.join(part[pivot] for part, pivot in zip(parts, local))).encode('utf-8')).hexdigest()
+
+  def get_counts(self):
+    ''' an empty array to hold the counts for every cut of the grid '''
+    return np.zeros(len(self), dtype=counts_dtype)
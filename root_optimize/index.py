@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import json
+import os
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the workers find the index through this, like numexpr finds its number of threads
+environment_variable = 'ROOPTIMIZE_INDEX'
+
+def get_fingerprint(filename):
+  ''' (size, modification time) of a file, which changes whenever the file is rewritten, None if it is not a local file
+        - a checksum would have to read every byte of the file, which is what the index is there to avoid
+  '''
+  try:
+    stat = os.stat(filename)
+  except OSError:
+    return None
+  return [stat.st_size, stat.st_mtime]
+
+#@echo(write=logger.debug)
+def read_metadata(filename, tree_name):
+  ''' Open up a single file and read the number of entries, the branches and the types of the leaves of its tree from the header
+        - returns None if the tree is not in the file
+  '''
+  from .lazy import ROOT
+  f = ROOT.TFile.Open(filename)
+  try:
+    tree = f.Get(tree_name) if f else None
+    if not tree: return None
+    return {'entries': int(tree.GetEntries()),
+            'branches': [branch.GetName() for branch in tree.GetListOfBranches()],
+            'leaves': dict((leaf.GetName(), leaf.GetTypeName()) for leaf in tree.GetListOfLeaves())}
+  finally:
+    if f: f.Close()
+
+class Index(object):
+  ''' A json file with the metadata of the trees in the input files, so they only have to be opened once
+        - for every file: its fingerprint (see `get_fingerprint`), and for every tree the entries, branches and leaf types
+        - an entry is only used while the fingerprint of the file still matches, otherwise it is read again
+  '''
+  def __init__(self, filename):
+    self.filename = filename
+    self.files = {}
+    if os.path.isfile(filename):
+      with open(filename) as f:
+        self.files = json.load(f)
+
+  def get(self, filename, tree_name):
+    ''' the metadata of the tree in the file, None if it is not in the index or the file changed since '''
+    entry = self.files.get(os.path.abspath(filename))
+    if entry is None or entry['fingerprint'] != get_fingerprint(filename): return None
+    return entry['trees'].get(tree_name)
+
+  #@echo(write=logger.debug)
+  def update(self, filenames, tree_name, num_cores=1):
+    ''' read the metadata of the files that are not in the index (or changed) in parallel, and save the index
+        - returns how many files were read
+    '''
+    missing = sorted(set(filename for filename in filenames if self.get(filename, tree_name) is None and get_fingerprint(filename) is not None))
+    if not missing: return 0
+    logger.log(25, "Indexing {0:d} files into {1:s}".format(len(missing), self.filename))
+    from joblib import Parallel, delayed
+    results = Parallel(n_jobs=min(num_cores, len(missing)))(delayed(read_metadata)(filename, tree_name) for filename in missing)
+    for filename, metadata in zip(missing, results):
+      if metadata is None: continue
+      entry = self.files.setdefault(os.path.abspath(filename), {'fingerprint': get_fingerprint(filename), 'trees': {}})
+      # the file changed, so what was there about its other trees is stale too
+      if entry['fingerprint'] != get_fingerprint(filename): entry.update(fingerprint=get_fingerprint(filename), trees={})
+      entry['trees'][tree_name] = metadata
+    self.save()
+    return len(missing)
+
+  def save(self):
+    directory = os.path.dirname(os.path.abspath(self.filename))
+    if not os.path.exists(directory): os.makedirs(directory)
+    # write next to it and move it into place, so another run never reads half of it
+    tmp = '{0:s}.{1:d}.tmp'.format(self.filename, os.getpid())
+    with open(tmp, 'w+') as f:
+      f.write(json.dumps(self.files, sort_keys=True, indent=2))
+    os.rename(tmp, self.filename)
+
+_index = None
+
+def get_index():
+  ''' the index in use (see `use_index`), loaded once in every process, or None '''
+  global _index
+  filename = os.environ.get(environment_variable)
+  if filename is None: return None
+  if _index is None or _index.filename != filename: _index = Index(filename)
+  return _index
+
+def set_index(filename):
+  ''' use the index in filename from now on, in this process and the processes it starts, without updating it '''
+  os.environ[environment_variable] = filename
+
+def use_index(filename, filenames, tree_name, num_cores=1):
+  ''' bring the index in filename up to date with the files, and use it from now on, in this process and its workers
+        - joblib keeps its worker processes around for the next call, so this is set before they are started
+          to update the index (`utils.do_cut` is handed the filename as well, for workers started before)
+  '''
+  global _index
+  set_index(filename)
+  _index = Index(filename)
+  _index.update(filenames, tree_name, num_cores)
+  return _index
+
+def get_metadata(filename, tree_name):
+  ''' the metadata of the tree in the file from the index in use, None if there is none '''
+  index = get_index()
+  return index.get(filename, tree_name) if index is not None else None
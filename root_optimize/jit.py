@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import ast
+import numpy as np
+
+from . import utils
+
+import logging
+logger = logging.getLogger(__name__)
+
+# numba is optional, without it the cuts are applied with numexpr
+try:
+  import numba
+except ImportError:
+  numba = None
+
+# only operations that give the same answer down to the last bit as numexpr are translated
+_binary_ops = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.BitAnd: '&', ast.BitOr: '|'}
+_compare_ops = {ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==', ast.NotEq: '!='}
+_unary_ops = {ast.USub: '-', ast.UAdd: '+'}
+
+_kernel_template = '''
+def fused_cuts({arguments}weights, out):
+  n = 0
+  for i in range(weights.shape[0]):
+    if weights[i] != 0:
+      if {expression}:
+        out[n] = weights[i]
+        n += 1
+  return n
+'''
+
+#@echo(write=logger.debug)
+def expression_to_source(node, names):
+  ''' Translate a numexpr expression (parsed with `ast`) into python source numba can compile
+        - names maps each variable of the expression onto the source to use for it
+        - raises a ValueError for anything that is not arithmetic, a comparison, `&`, `|` or `abs()`
+  '''
+  if isinstance(node, ast.Expression):
+    return expression_to_source(node.body, names)
+  if isinstance(node, ast.BinOp) and type(node.op) in _binary_ops:
+    return '({0:s} {1:s} {2:s})'.format(expression_to_source(node.left, names), _binary_ops[type(node.op)], expression_to_source(node.right, names))
+  if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _compare_ops:
+    return '({0:s} {1:s} {2:s})'.format(expression_to_source(node.left, names), _compare_ops[type(node.ops[0])], expression_to_source(node.comparators[0], names))
+  if isinstance(node, ast.UnaryOp) and type(node.op) in _unary_ops:
+    return '({0:s}{1:s})'.format(_unary_ops[type(node.op)], expression_to_source(node.operand, names))
+  if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'abs' and len(node.args) == 1 and not node.keywords:
+    return 'abs({0:s})'.format(expression_to_source(node.args[0], names))
+  if isinstance(node, ast.Name) and node.id in names:
+    return names[node.id]
+  if type(node).__name__ in ('Num', 'Constant', 'NameConstant'):
+    value = node.value if hasattr(node, 'value') else node.n
+    if isinstance(value, (bool, int, float)): return repr(value)
+  raise ValueError('cannot compile {0:s}'.format(ast.dump(node)))
+
+#@echo(write=logger.debug)
+def get_arithmetic_names(node):
+  ''' The variables of an expression (parsed with `ast`) that feed into arithmetic (`+`, `-`, `*`, `/`) '''
+  from .selection import is_boolean
+  # the cuts are multiplied together (see `utils.cuts_to_selection`), which is not arithmetic on the branches
+  if isinstance(node, ast.BinOp) and not isinstance(node.op, (ast.BitAnd, ast.BitOr)) and not is_boolean(node):
+    return set(child.id for child in ast.walk(node) if isinstance(child, ast.Name))
+  names = set()
+  for child in ast.iter_child_nodes(node): names |= get_arithmetic_names(child)
+  return names
+
+class FusedCuts(object):
+  ''' Apply a cut with a single compiled loop over the events
+        - the selections of the supercuts are compiled once, with their pivots as arguments
+        - every event is tested and, if it passes, its weight is written out compactly in the same loop,
+          so no full-length array is materialized for a cut
+        - the weights that passed are summed the same way `utils.apply_cuts` does, so the counts are
+          identical to the numpy engine
+        - numexpr does arithmetic on float32 (and integer) branches in their own type while numba promotes
+          them, so only float64 branches can be used in arithmetic, a ValueError is raised otherwise
+
+      Calling it on a cut returns (rawEvents, weightedEvents) like `utils.apply_cuts`.
+  '''
+  def __init__(self, arr, supercuts, weights):
+    placeholders = []
+    selections = []
+    for index, supercut in enumerate(supercuts):
+      numSlots = len(supercut['st3']) if 'st3' in supercut else len(supercut['pivot'])
+      placeholders.append(['__pivot{0:d}_{1:d}'.format(index, slot) for slot in range(numSlots)])
+      selections.append({'selections': supercut['selections'], 'pivot': placeholders[-1]})
+    # build the selection exactly like `utils.apply_cuts`, so the operations happen in the same order
+    entireSelection = utils.cuts_to_selection(selections)
+    tree = ast.parse(entireSelection, mode='eval')
+    narrow = sorted(name for name in get_arithmetic_names(tree) if name in arr.dtype.names and arr.dtype[name] != np.float64)
+    if narrow: raise ValueError('numexpr does the arithmetic on {0:s} in a narrower type than numba would'.format(', '.join(narrow)))
+
+    names = {}
+    arguments = []
+    self.columns = []
+    for branch in arr.dtype.names:
+      names[branch] = 'column{0:d}[i]'.format(len(self.columns))
+      arguments.append('column{0:d}'.format(len(self.columns)))
+      self.columns.append(arr[branch])
+    for placeholder in sum(placeholders, []):
+      names[placeholder] = 'pivot{0:d}'.format(len(arguments) - len(self.columns))
+      arguments.append(names[placeholder])
+
+    source = _kernel_template.format(arguments=''.join('{0:s}, '.format(argument) for argument in arguments),
+                                     expression=expression_to_source(tree, names))
+    namespace = {}
+    exec(source, namespace)
+    # numpy error model so that dividing by zero gives inf/nan like numexpr instead of raising,
+    #   and without the GIL so the workers of the thread backend can run it at the same time
+    self.kernel = numba.njit(error_model='numpy', nogil=True)(namespace['fused_cuts'])
+    self.weights = weights
+    self.out = np.empty_like(weights)
+
+  def __call__(self, cut):
+    # read the pivots back from how they are written in the selection, which is what numexpr compares to
+    pivots = [ast.literal_eval('{0}'.format(value)) for item in cut for value in item['pivot']]
+    numPassed = self.kernel(*(self.columns + pivots + [self.weights, self.out]))
+    return float(numPassed), float(np.sum(self.out[:numPassed]))
+
+#@echo(write=logger.debug)
+def get_fused_cuts(arr, grid, weights):
+  ''' Compile the supercuts of the grid into a `FusedCuts`, or return None if the numexpr engine has to be used instead
+        - numba needs to be installed and the selections must only use operations it can reproduce exactly
+        - the first, middle and last cuts are checked against `utils.apply_cuts` before anything is trusted to it
+  '''
+  if numba is None or not arr.size or not grid.supercuts or not len(grid): return None
+  try:
+    fused = FusedCuts(arr, grid.supercuts, weights)
+    for index in sorted(set([0, len(grid)//2, len(grid)-1])):
+      cut = grid.get_cut(index)
+      if fused(cut) != utils.apply_cuts(arr, cut, None, doNumpy=True, weights=weights):
+        raise ValueError('the counts do not match the numpy engine')
+  except Exception as e:
+    logger.warning("Not using numba for the cuts, falling back to numexpr: {0}".format(e))
+    return None
+  return fused
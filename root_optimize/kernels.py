@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import numpy as np
+import numexpr as ne
+
+import logging
+logger = logging.getLogger(__name__)
+
+# number of (event, pivot) pairs to test at once, small enough to stay in cache
+tile_size = 1 << 18
+
+#@echo(write=logger.debug)
+def count_pivots(columns, weights, supercut, pivots, tile_size=tile_size):
+  ''' Count the events passing a supercut for a whole list of pivots at once
+        - columns is a dict of the branches used by the supercut, weights are the event weights
+        - each tile of events is compared against every pivot in one broadcast (events x pivots),
+          so the events are read once per tile instead of once per pivot
+        - works for selections with any number of pivots, eg: `(x > {0}) & (x < {1})`
+
+      Returns the raw and weighted counts for each pivot as two arrays.
+  '''
+  pivots = np.asarray(pivots)
+  numPivots, numSlots = pivots.shape
+  selection = supercut['selections'].format(*['__pivot{0:d}'.format(slot) for slot in range(numSlots)])
+  rows = dict(('__pivot{0:d}'.format(slot), pivots[np.newaxis, :, slot]) for slot in range(numSlots))
+
+  rawEvents = np.zeros(numPivots, dtype=np.int64)
+  weightedEvents = np.zeros(numPivots, dtype=np.float64)
+  numEvents = weights.size
+  step = max(1, tile_size//max(numPivots, 1))
+  for start in range(0, numEvents, step):
+    stop = min(start+step, numEvents)
+    local_dict = dict((branch, column[start:stop, np.newaxis]) for branch, column in columns.items())
+    local_dict.update(rows)
+    passed = np.broadcast_to(ne.evaluate(selection, local_dict=local_dict), (stop-start, numPivots))
+    rawEvents += np.count_nonzero(passed, axis=0)
+    weightedEvents += np.dot(weights[start:stop], passed)
+  return rawEvents, weightedEvents
+
+#@echo(write=logger.debug)
+def count_sorted(values, weights, lower, upper, pivots):
+  ''' Count the events inside a window for a whole list of pivots using prefix sums
+        - values are the expression the window is on, weights are the event weights
+        - lower and upper are (op, pivot index) for each side of the window, or None if open
+        - sorting once lets every window be answered with a pair of searchsorted calls, so
+          this costs O(n log n + windows) instead of O(n x windows)
+
+      Returns the raw and weighted counts for each pivot as two arrays.
+  '''
+  pivots = np.asarray(pivots)
+  # compare in the same precision numexpr would
+  values = values.astype(np.result_type(values.dtype, pivots.dtype), copy=False)
+  order = np.argsort(values, kind='mergesort')
+  sorted_values = values[order]
+  # the running sum is kept in extended precision to limit the rounding of the differences
+  cumulative = np.concatenate(([0], np.cumsum(weights[order], dtype=np.longdouble)))
+
+  # NaN sorts last and never passes a comparison
+  numValid = sorted_values.size
+  if sorted_values.dtype.kind == 'f': numValid -= np.count_nonzero(np.isnan(sorted_values))
+
+  lo = np.zeros(len(pivots), dtype=np.int64)
+  hi = np.full(len(pivots), numValid, dtype=np.int64)
+  if lower is not None:
+    op, index = lower
+    lo = np.searchsorted(sorted_values, pivots[:, index], side='right' if op == '>' else 'left')
+  if upper is not None:
+    op, index = upper
+    hi = np.searchsorted(sorted_values, pivots[:, index], side='left' if op == '<' else 'right')
+  hi = np.maximum(hi, lo)
+  return hi - lo, (cumulative[hi] - cumulative[lo]).astype(np.float64)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import importlib
+
+import logging
+logger = logging.getLogger(__name__)
+
+class LazyModule(object):
+  ''' Stands in for a module that is only imported the first time one of its attributes is used
+        - ROOT and root_numpy take seconds to import, and most subcommands never need them
+        - setup(module) is called once, right after the import
+        - the lazy modules in requires are imported (and set up) first
+  '''
+  def __init__(self, name, setup=None, requires=()):
+    self.__dict__['_name'] = name
+    self.__dict__['_setup'] = setup
+    self.__dict__['_requires'] = requires
+    self.__dict__['_module'] = None
+
+  def _load(self):
+    if self._module is None:
+      for module in self._requires: module._load()
+      logger.debug("Importing {0:s}".format(self._name))
+      module = importlib.import_module(self._name)
+      if self._setup is not None: self._setup(module)
+      self.__dict__['_module'] = module
+    return self._module
+
+  def __getattr__(self, attr):
+    return getattr(self._load(), attr)
+
+  def __setattr__(self, attr, value):
+    setattr(self._load(), attr, value)
+
+def setup_root(module):
+  module.PyConfig.IgnoreCommandLineOptions = True
+  module.gROOT.SetBatch(True)
+
+ROOT = LazyModule('ROOT', setup_root)
+# root_numpy imports ROOT itself, so set up ROOT first
+root_numpy = LazyModule('root_numpy', requires=(ROOT,))
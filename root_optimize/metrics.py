@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import json
+import multiprocessing
+import os
+import threading
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from . import timing
+
+import logging
+logger = logging.getLogger(__name__)
+
+class Reporter(object):
+  ''' Handed to the workers to send their progress to the `Monitor` of the parent
+        - `start(job)` and `done(job, ok)` bracket every job, `update(cuts=..., events=...)` adds to the counters
+        - the updates are sent at most every interval seconds, since the cuts can report progress for every cut
+        - every message carries the process id and the memory it uses
+  '''
+  def __init__(self, messages, interval=1.):
+    self.messages = messages
+    self.interval = interval
+    self.__setstate__(self.__getstate__())
+
+  def __getstate__(self):
+    return {'messages': self.messages, 'interval': self.interval}
+
+  def __setstate__(self, state):
+    # the counters and the lock are per process, the workers start off with their own
+    self.__dict__.update(state)
+    self.lock = threading.Lock()
+    self.pending = {'cuts': 0, 'events': 0}
+    self.last = 0.
+
+  def send(self, kind, **values):
+    values.update(pid=os.getpid(), rss=timing.get_rss())
+    self.messages.put((kind, values))
+
+  def flush(self):
+    with self.lock:
+      pending, self.pending = self.pending, {'cuts': 0, 'events': 0}
+      self.last = timing.wall_clock()
+    if any(pending.values()): self.send('update', **pending)
+
+  def start(self, job):
+    self.send('start', job=job)
+
+  def update(self, **counts):
+    with self.lock:
+      for name, count in counts.items(): self.pending[name] += count
+      due = timing.wall_clock() - self.last > self.interval
+    if due: self.flush()
+
+  def done(self, job, ok):
+    self.flush()
+    self.send('done', job=job, ok=ok)
+
+class Monitor(object):
+  ''' Collects the progress of the workers in the parent and writes it out every interval seconds
+        - the file is JSON, or the Prometheus text format if it ends with .prom (eg: for the textfile
+          collector of the node exporter), and is replaced in one go so it is never read half written
+        - the labels are added to every Prometheus metric, to tell apart the runs writing to one place
+        - with processes the messages go through a queue of a multiprocessing manager, which the
+          joblib workers can be handed, otherwise through a plain queue
+  '''
+  def __init__(self, filename, numJobs, numCuts, interval=10., processes=True, labels=None):
+    self.filename = filename
+    self.interval = interval
+    self.labels = labels or {}
+    self.manager = multiprocessing.Manager() if processes else None
+    self.messages = self.manager.Queue() if processes else queue.Queue()
+    self.start = timing.wall_clock()
+    self.state = {'jobs_total': numJobs, 'jobs_done': 0, 'jobs_failed': 0, 'cuts_total': numCuts, 'cuts_done': 0, 'events_read': 0}
+    self.running = {}
+    self.rss = {}
+    self.thread = threading.Thread(target=self.collect)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def reporter(self):
+    return Reporter(self.messages)
+
+  def handle(self, kind, values):
+    self.rss[values['pid']] = values['rss']
+    if kind == 'start':
+      self.running[values['job']] = values['pid']
+    elif kind == 'update':
+      self.state['cuts_done'] += values['cuts']
+      self.state['events_read'] += values['events']
+    elif kind == 'done':
+      self.running.pop(values['job'], None)
+      self.state['jobs_done'] += 1
+      self.state['jobs_failed'] += not values['ok']
+
+  def collect(self):
+    last = timing.wall_clock()
+    while True:
+      try:
+        message = self.messages.get(timeout=max(last + self.interval - timing.wall_clock(), 0.01))
+      except queue.Empty:
+        message = None
+      if message == 'stop': break
+      if message is not None: self.handle(*message)
+      if timing.wall_clock() - last > self.interval:
+        self.write()
+        last = timing.wall_clock()
+
+  def get_metrics(self):
+    elapsed = timing.wall_clock() - self.start
+    metrics = dict(self.state)
+    metrics['jobs_running'] = len(self.running)
+    metrics['elapsed_seconds'] = elapsed
+    metrics['cuts_per_second'] = self.state['cuts_done']/elapsed if elapsed else 0.
+    metrics['events_per_second'] = self.state['events_read']/elapsed if elapsed else 0.
+    # the rate so far is the best guess for the rest of the run
+    remaining = max(self.state['cuts_total'] - self.state['cuts_done'], 0)
+    metrics['eta_seconds'] = remaining/metrics['cuts_per_second'] if metrics['cuts_per_second'] else None
+    metrics['rss_mb'] = dict((str(pid), rss) for pid, rss in self.rss.items())
+    metrics['rss_mb'][str(os.getpid())] = timing.get_rss()
+    return metrics
+
+  def format_prometheus(self, metrics):
+    labels = ','.join('{0:s}="{1:s}"'.format(name, value) for name, value in sorted(self.labels.items()))
+    lines = []
+    for name, value in sorted(metrics.items()):
+      if name == 'rss_mb': continue
+      if value is None: value = float('nan')
+      lines.append('rooptimize_{0:s}{{{1:s}}} {2}'.format(name, labels, value))
+    for pid, rss in sorted(metrics['rss_mb'].items()):
+      lines.append('rooptimize_rss_mb{{{0:s}}} {1}'.format(','.join(filter(None, [labels, 'pid="{0:s}"'.format(pid)])), rss))
+    return '\n'.join(lines) + '\n'
+
+  def write(self):
+    metrics = self.get_metrics()
+    if self.filename.endswith('.prom'):
+      contents = self.format_prometheus(metrics)
+    else:
+      contents = json.dumps(dict(metrics, labels=self.labels), sort_keys=True, indent=2)
+    # write next to it and move it into place, so whatever reads it never sees half of it
+    tmp = '{0:s}.tmp'.format(self.filename)
+    with open(tmp, 'w+') as f:
+      f.write(contents)
+    os.rename(tmp, self.filename)
+    logger.info("{0:d}/{1:d} cuts, {2:0.0f} cuts/s, {3:0.0f} events/s".format(metrics['cuts_done'], metrics['cuts_total'], metrics['cuts_per_second'], metrics['events_per_second']))
+
+  def close(self):
+    ''' stop collecting, and write out the last of it '''
+    self.messages.put('stop')
+    self.thread.join()
+    while True:
+      try:
+        self.handle(*self.messages.get_nowait())
+      except queue.Empty:
+        break
+    self.write()
+    if self.manager is not None: self.manager.shutdown()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import json
+import os
+
+from . import timing
+from . import utils
+from .schedule import get_jobs, schedule
+
+import logging
+logger = logging.getLogger(__name__)
+
+# (event x cut) every engine gets through in a second on one core, until the timing report of an earlier run
+# says better: numexpr and numba were measured on a laptop, TTree::Draw is a guess
+default_rates = {'numba': 1e8, 'numpy': 1.2e7, 'root': 5e6}
+# TTree::Draw also pays for setting up every cut
+root_seconds_per_cut = 2e-3
+# events read in by root_numpy every second, and the time it takes to write out the counts of a cut
+default_read_rate = 1e6
+serialize_seconds_per_cut = 2e-5
+# bytes the counts of a cut take while they are written out (python objects and json), and in the output file
+memory_per_cut = 1250
+disk_per_cut = 125
+# python, numpy, numexpr and ROOT in every worker process
+memory_per_process = 200*1024**2
+# bytes per entry of the types of leaves, anything else (eg: a vector) is taken to be 8
+leaf_sizes = {'Bool_t': 1, 'Char_t': 1, 'UChar_t': 1, 'Short_t': 2, 'UShort_t': 2, 'Int_t': 4, 'UInt_t': 4,
+              'Float_t': 4, 'Long64_t': 8, 'ULong64_t': 8, 'Double_t': 8,
+              'bool': 1, 'char': 1, 'short': 2, 'int': 4, 'float': 4, 'long': 8, 'double': 8}
+
+def get_engines():
+  ''' the engines that can apply the cuts here, numba is only there if it is installed '''
+  from .jit import numba
+  return (['numba'] if numba is not None else []) + ['numpy', 'root']
+
+def get_engine(doNumpy, doJIT):
+  ''' the engine the cuts are applied with for the --numpy and --no-jit flags '''
+  if not doNumpy: return 'root'
+  if not doJIT: return 'numpy'
+  from .jit import numba
+  return 'numpy' if numba is None else 'numba'
+
+def get_available_memory():
+  ''' the memory that can be used without swapping, in bytes, or None if it cannot be told '''
+  try:
+    with open('/proc/meminfo') as f:
+      for line in f:
+        if line.startswith('MemAvailable:'): return int(line.split()[1])*1024
+  except (IOError, OSError, ValueError):
+    pass
+  try:
+    return os.sysconf('SC_PHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')
+  except (AttributeError, OSError, ValueError):
+    return None
+
+def format_bytes(size):
+  for unit in ['B', 'KB', 'MB', 'GB']:
+    if size < 1024.: return '{0:0.1f} {1:s}'.format(size, unit)
+    size /= 1024.
+  return '{0:0.1f} TB'.format(size)
+
+#@echo(write=logger.debug)
+def get_row_size(tree_name, filename, branches):
+  ''' bytes every event takes in the array of a DID, from the types of the leaves in the header of one of its files '''
+  types = utils.get_branch_types(tree_name, filename, branches)
+  return sum(leaf_sizes.get(types.get(branch), 8) for branch in branches)
+
+#@echo(write=logger.debug)
+def get_rates(report):
+  ''' the rates of the engines, with the one used by an earlier run measured from its timing report (see `timing.write_report`)
+        - returns the rate of every engine in (event x cut) per second, and the events read in per second
+  '''
+  rates, read_rate = dict(default_rates), default_read_rate
+  if report is None or not os.path.isfile(report): return rates, read_rate
+  with open(report) as f:
+    filename, report = report, json.load(f)
+  engine = report.get('engine')
+  jobs = report.get('jobs', [])
+  work = sum(job['counts'].get('events', 0)*job['counts'].get('cuts', 0) for job in jobs)
+  scan = sum(job['phases'].get('scan', {}).get('wall', 0.) for job in jobs)
+  if engine == 'root': scan -= sum(job['counts'].get('cuts', 0) for job in jobs)*root_seconds_per_cut
+  if engine in rates and work and scan > 0:
+    rates[engine] = work/scan
+    logger.info("Measured {0:0.3g} (event x cut)/s for {1:s} in {2:s}".format(rates[engine], engine, filename))
+  events = sum(job['counts'].get('events', 0) for job in jobs)
+  if engine != 'root' and events and report.get('io_wall'): read_rate = events/report['io_wall']
+  return rates, read_rate
+
+def get_footprint(engine, entries, rowSize, numCuts):
+  ''' bytes a job applying numCuts to a DID of entries events takes while it runs '''
+  memory = numCuts*memory_per_cut
+  # the array, the event weights and a mask of the events to count
+  if engine != 'root': memory += entries*(rowSize + 9)
+  return memory
+
+def estimate_job(engine, entries, rowSize, numCuts, rates, read_rate):
+  ''' (seconds, bytes) a job applying numCuts to a DID of entries events takes on one core '''
+  seconds = entries*float(numCuts)/rates[engine] + numCuts*serialize_seconds_per_cut
+  if engine == 'root':
+    seconds += numCuts*root_seconds_per_cut
+  else:
+    seconds += entries/read_rate
+  return seconds, get_footprint(engine, entries, rowSize, numCuts)
+
+#@echo(write=logger.debug)
+def make_plan(dids, tree_name, branches, numCuts, maxCores, backend='processes', report=None):
+  ''' Estimate how long the cuts take, and how much memory and disk they need, with every engine and number of
+      cores (with and without --split-dids), from the entries and the branch types in the headers of the files
+        - no events are read in, the rates come from `get_rates`
+        - the runtime is that of the busiest core once the jobs are scheduled (see `schedule.schedule`)
+        - the memory is that of the biggest jobs all running at once, so it is an upper bound
+        - returns a list of dicts with the engine, cores, split, seconds, memory and disk of every plan
+  '''
+  entries = dict((did, utils.get_entries(tree_name, files)) for did, files in dids.items())
+  rowSizes = dict((did, get_row_size(tree_name, files[0], branches)) for did, files in dids.items())
+  rates, read_rate = get_rates(report)
+  numProcesses = lambda cores: cores if backend == 'processes' else 1
+  coreCounts = sorted(set([2**power for power in range(maxCores.bit_length()) if 2**power <= maxCores] + [maxCores]))
+  disk = len(dids)*numCuts*disk_per_cut
+
+  plans = []
+  for engine in get_engines():
+    # the scheduler balances the cost, in microseconds here
+    costs = dict((did, estimate_job(engine, entries[did], rowSizes[did], numCuts, rates, read_rate)[0]*1e6) for did in dids)
+    for cores in coreCounts:
+      for split in [False, True]:
+        jobs = get_jobs(dids, costs, numCuts, cores, split)
+        # splitting only makes a different plan if it split something
+        if split and len(jobs) == len(dids): continue
+        workers, work = schedule(jobs, costs, numCuts, cores)
+        memories = sorted((estimate_job(engine, entries[did], rowSizes[did], numCuts if shard is None else shard[1]-shard[0], rates, read_rate)[1] for did, files, shard in jobs), reverse=True)
+        plans.append({'engine': engine, 'cores': cores, 'split': split,
+                      'seconds': max(work)/1e6,
+                      'memory': sum(memories[:cores]) + numProcesses(cores)*memory_per_process,
+                      'disk': disk})
+  return plans
+
+#@echo(write=logger.debug)
+def recommend(plans, budget=None):
+  ''' The fastest plan that fits in the memory budget (bytes), or the one using the least memory if none fit
+        - of the plans within 5% of the fastest, the one with the fewest cores is picked, without splitting if it can
+  '''
+  fits = [plan for plan in plans if budget is None or plan['memory'] <= budget]
+  if not fits: return min(plans, key=lambda plan: plan['memory'])
+  fastest = min(plan['seconds'] for plan in fits)
+  return min((plan for plan in fits if plan['seconds'] <= fastest*1.05), key=lambda plan: (plan['cores'], plan['split'], plan['seconds']))
+
+def print_plan(plans, best, budget=None):
+  logger.log(25, "{0:>8s} {1:>6s} {2:>6s} {3:>16s} {4:>12s} {5:>12s}".format('engine', 'cores', 'split', 'runtime', 'memory', 'disk'))
+  for plan in plans:
+    logger.log(25, "{0:>8s} {1:>6d} {2:>6s} {3:>16s} {4:>12s} {5:>12s}{6:s}".format(
+      plan['engine'], plan['cores'], 'yes' if plan['split'] else 'no', timing.secondsToStr(plan['seconds']),
+      format_bytes(plan['memory']), format_bytes(plan['disk']),
+      ' <- recommended' if plan is best else (' (does not fit)' if budget is not None and plan['memory'] > budget else '')))
+  if budget is not None: logger.log(25, "Memory budget: {0:s}".format(format_bytes(budget)))
+  if budget is not None and best['memory'] > budget:
+    logger.warning("None of the plans fit in the memory, use fewer cores or fewer cuts")
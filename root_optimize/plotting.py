@@ -3,8 +3,7 @@
 
 
 
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
+from .lazy import ROOT
 
 import csv
 import numpy as np
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import collections
+import itertools
+import numpy as np
+import numexpr as ne
+
+from . import utils
+from . import kernels
+
+import logging
+logger = logging.getLogger(__name__)
+
+#@echo(write=logger.debug)
+def get_pivots(supercut):
+  ''' List the pivots of a supercut in the same order `utils.get_cut` generates them '''
+  return list(itertools.product(*(np.arange(*st3) for st3 in supercut['st3'])))
+
+#@echo(write=logger.debug)
+def get_pivots_loosest_first(supercut):
+  ''' Order the pivots of a supercut from the loosest to the tightest cut
+        - returns the pivots and whether the supercut is monotone in its pivot
+        - if it is not monotone, the pivots are left in the order `utils.get_cut` generates them
+  '''
+  pivots = get_pivots(supercut)
+  direction = 0
+  if len(supercut['st3']) == 1:
+    direction = utils.selection_direction(supercut['selections'])
+  if direction:
+    pivots.sort(key=lambda pivot: direction*pivot[0])
+  return pivots, bool(direction)
+
+#@echo(write=logger.debug)
+def get_envelope(supercuts):
+  ''' The cuts that every cut generated by the supercuts is at least as tight as
+        - this is every fixed supercut, and the loosest pivot of every monotone supercut
+        - supercuts with no direction (eg: windows) are left out, they could keep anything
+  '''
+  envelope = []
+  for supercut in supercuts:
+    if 'st3' not in supercut:
+      envelope.append({'selections': supercut['selections'], 'pivot': supercut['pivot']})
+      continue
+    pivots, monotone = get_pivots_loosest_first(supercut)
+    if monotone and pivots:
+      envelope.append({'selections': supercut['selections'], 'pivot': pivots[0]})
+  return envelope
+
+#@echo(write=logger.debug)
+def get_bounds(supercut):
+  ''' Describe a threshold or window supercut as (expression, lower, upper)
+        - lower and upper are (op, pivot index) for each side, or None if that side is open
+        - returns None for any other kind of selection
+  '''
+  if len(supercut['st3']) == 1:
+    threshold = utils.get_threshold(supercut['selections'])
+    if threshold is None: return None
+    expression, op = threshold
+    return (expression, (op, 0), None) if op.startswith('>') else (expression, None, (op, 0))
+  if len(supercut['st3']) == 2:
+    return utils.get_window(supercut['selections'])
+  return None
+
+#@echo(write=logger.debug)
+def get_pivot_classes(arr, supercut):
+  ''' Map each pivot of a threshold supercut onto the set of events it keeps
+        - pivots that fall between the same two distinct values of the expression keep the same
+          events, so they get the same class (so do all pivots beyond the largest value)
+        - returns None if the supercut is not a simple threshold (`x > {0}`)
+  '''
+  threshold = utils.get_threshold(supercut['selections']) if len(supercut['st3']) == 1 else None
+  if threshold is None: return None
+  expression, op = threshold
+  # numexpr compares in double precision
+  values = np.unique(ne.evaluate(expression, local_dict=arr)).astype(np.float64)
+  side = 'right' if op in ('>', '<=') else 'left'
+  return dict((pivot, int(np.searchsorted(values, pivot[0], side=side))) for pivot in get_pivots(supercut))
+
+#@echo(write=logger.debug)
+def get_cut_classes(arr, supercuts):
+  return [get_pivot_classes(arr, supercut) if 'st3' in supercut else None for supercut in supercuts]
+
+#@echo(write=logger.debug)
+def get_n_classes(supercuts, classes):
+  total = 1
+  for supercut, pivot_classes in zip(supercuts, classes):
+    if 'st3' in supercut:
+      total *= len(get_pivots(supercut)) if pivot_classes is None else len(set(pivot_classes.values()))
+  return total
+
+#@echo(write=logger.debug)
+def get_class_codes(grid, classes):
+  ''' For every supercut of the grid, number the classes of its pivots in the order the grid has them
+        - supercuts without classes get one class per pivot, fixed supercuts have the one
+  '''
+  codes = []
+  for supercut, size, pivot_classes in zip(grid.supercuts, grid.sizes, classes):
+    if pivot_classes is None:
+      codes.append(np.arange(size))
+    else:
+      codes.append(np.unique([pivot_classes[pivot] for pivot in get_pivots(supercut)], return_inverse=True)[1].reshape(-1))
+  return codes
+
+#@echo(write=logger.debug)
+def apply_cuts_once(arr, grid, weights, classes, counts, fused=None):
+  ''' Apply every cut of the grid, evaluating each class of equivalent cuts once
+        - the class of every cut in a block of the grid is computed at once, and only the first cut
+          of every class that was not seen before gets evaluated
+        - weights are the event weights (from `utils.get_event_weights`)
+        - if fused (from `jit.get_fused_cuts`) is given, it applies the cuts instead of numexpr
+        - like `scan_cuts`, this fills in counts and yields how many cuts it filled in as it goes, but never prunes
+  '''
+  codes = get_class_codes(grid, classes)
+  memo = {}
+  for start, stop, indices in grid.iter_blocks():
+    keys = np.zeros(indices.size, dtype=np.int64)
+    for code, local in zip(codes, grid.get_locals(indices)):
+      keys = keys*max(code.size, 1) + code[local]
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    for key, index in zip(unique.tolist(), first.tolist()):
+      if key in memo: continue
+      cut = grid.get_cut(indices[index])
+      memo[key] = utils.apply_cuts(arr, cut, None, doNumpy=True, weights=weights) if fused is None else fused(cut)
+    values = np.array([memo[key] for key in unique.tolist()])
+    counts['raw'][start:stop] = values[inverse.reshape(-1), 0]
+    counts['weighted'][start:stop] = values[inverse.reshape(-1), 1]
+    yield stop - start
+
+#@echo(write=logger.debug)
+def get_mask(arr, cut):
+  mask = utils.apply_cut(arr, cut)
+  if mask.dtype != np.bool_: mask = mask != 0
+  return mask
+
+#@echo(write=logger.debug)
+def scan_cuts(arr, grid, weights, counts, prune_below=1, classes=None, sparse_below=0.05, tile_size=kernels.tile_size):
+  ''' Branch-and-bound scan over all of the cuts of the grid
+        - arr is the rnp.tree2array() np.array of the tree, weights are the event weights (from `utils.get_event_weights`)
+        - each supercut is applied on top of the events kept by the supercuts before it, so prefixes are shared
+        - once a prefix keeps fewer than `prune_below` raw events, every cut built on it is recorded as empty
+        - for monotone supercuts (`x > {0}`), all tighter pivots of that supercut are recorded as empty too
+        - if classes (from `get_cut_classes`) are given, equivalent pivots are only scanned once
+        - once a prefix keeps less than a `sparse_below` fraction of the events, it switches from a
+          boolean mask to the indices of the events it keeps, and later cuts only look at those
+        - the pivots of the last supercut are all counted at once, with prefix sums over the sorted
+          values for thresholds and windows (`kernels.count_sorted`) or `kernels.count_pivots` otherwise
+
+      The cuts built on a prefix are a contiguous range of the grid, so pruned and equivalent parts of
+      the grid are recorded a whole range at a time. This fills in counts (from `grid.get_counts()`)
+      and yields how many cuts it filled in as it goes. With prune_below=1, the raw counts are exactly
+      those of `apply_cuts_once`, and the weighted counts only differ by rounding (~1e-12 relative),
+      since the weights are summed in a different order.
+  '''
+  scanner = _CutScanner(arr, grid, weights, counts, prune_below, classes, sparse_below, tile_size)
+  # events with no weight do not count, same as `utils.apply_cuts`
+  for numCuts in scanner.scan(scanner.restrict(scanner.weights != 0), 0, 0): yield numCuts
+
+class _CutScanner(object):
+  def __init__(self, arr, grid, weights, counts, prune_below, classes, sparse_below, tile_size):
+    self.arr = arr
+    self.grid = grid
+    self.supercuts = grid.supercuts
+    self.counts = counts
+    self.weights = weights
+    self.prune_below = prune_below
+    self.tile_size = tile_size
+    self.sparse_below = int(sparse_below*arr.size)
+    self.index_dtype = np.int32 if arr.size < np.iinfo(np.int32).max else np.int64
+    # the branches to gather for each supercut once the events are sparse
+    self.branches = [[branch for branch in set(utils.selection_to_branches(supercut['selections'], None)) if branch in arr.dtype.names] for supercut in self.supercuts]
+    self.classes = [None]*len(self.supercuts) if classes is None else classes
+    # the pivots of each supercut in the order of the grid, and the order to scan them in (loosest first)
+    self.pivots = []
+    self.orders = []
+    self.monotone = []
+    for supercut in self.supercuts:
+      if 'st3' not in supercut:
+        # a fixed cut only has the one pivot they specified
+        self.pivots.append(None)
+        self.orders.append([0])
+        self.monotone.append(False)
+        continue
+      pivots = get_pivots(supercut)
+      loosest, monotone = get_pivots_loosest_first(supercut)
+      local = dict((pivot, index) for index, pivot in enumerate(pivots))
+      self.pivots.append(pivots)
+      self.orders.append([local[pivot] for pivot in loosest])
+      self.monotone.append(monotone)
+
+  def restrict(self, mask):
+    ''' switch a mask over all events to the indices it keeps if it is selective enough '''
+    if np.count_nonzero(mask) < self.sparse_below:
+      return np.flatnonzero(mask).astype(self.index_dtype)
+    return mask
+
+  def select(self, events, index):
+    ''' apply the cut at index on top of the events (either a mask or sorted indices) '''
+    item = self.supercuts[index]
+    if events.dtype == np.bool_:
+      return self.restrict(events & get_mask(self.arr, item))
+    mask = get_mask(dict((branch, self.arr[branch][events]) for branch in self.branches[index]), item)
+    return events[np.broadcast_to(mask, events.shape)]
+
+  def count(self, events):
+    return np.count_nonzero(events) if events.dtype == np.bool_ else events.size
+
+  def get_class(self, index, pivot):
+    return pivot if self.classes[index] is None else self.classes[index][pivot]
+
+  def clip(self, start, stop):
+    ''' the part of the cuts from start to stop (indices of the full grid) that is in this shard '''
+    return max(start, self.grid.start), min(stop, self.grid.stop)
+
+  def fill(self, start, stop, values):
+    start, stop = self.clip(start, stop)
+    if stop <= start: return 0
+    self.counts[start-self.grid.start:stop-self.grid.start] = values
+    return stop - start
+
+  def copy(self, source, start, stop):
+    ''' copy the counts of the cuts starting at source over to the cuts from start to stop '''
+    lo, hi = self.clip(start, stop)
+    if hi <= lo: return 0
+    offset = source - start - self.grid.start
+    self.counts[lo-self.grid.start:hi-self.grid.start] = self.counts[lo+offset:hi+offset]
+    return hi - lo
+
+  def scan_pivots(self, events, index, base):
+    ''' the last supercut is not built on, so count all of its pivots at once '''
+    item = self.supercuts[index]
+    start, stop = self.clip(base, base+len(self.pivots[index]))
+    if stop <= start: return
+    pivots = self.pivots[index][start-base:stop-base]
+
+    # only count one pivot of each class of equivalent pivots
+    representatives = collections.OrderedDict()
+    for pivot in pivots: representatives.setdefault(self.get_class(index, pivot), pivot)
+    columns = dict((branch, self.arr[branch][events]) for branch in self.branches[index])
+    bounds = get_bounds(item)
+    if bounds is None:
+      rawEvents, weightedEvents = kernels.count_pivots(columns, self.weights[events], item, list(representatives.values()), self.tile_size)
+    else:
+      expression, lower, upper = bounds
+      rawEvents, weightedEvents = kernels.count_sorted(ne.evaluate(expression, local_dict=columns), self.weights[events], lower, upper, list(representatives.values()))
+
+    position = dict((pivot_class, k) for k, pivot_class in enumerate(representatives))
+    which = [position[self.get_class(index, pivot)] for pivot in pivots]
+    counts = self.counts[start-self.grid.start:stop-self.grid.start]
+    counts['raw'] = rawEvents[which]
+    counts['weighted'] = weightedEvents[which]
+    counts['pruned'] = False
+    yield stop - start
+
+  def scan(self, events, index, base):
+    ''' scan the cuts built on the events kept by the supercuts before index, which start at base in the grid '''
+    supercuts, classes, grid = self.supercuts, self.classes, self.grid
+    # reached bottom of iteration, count what survived
+    if index >= len(supercuts):
+      yield self.fill(base, base+1, (float(self.count(events)), float(np.sum(self.weights[events])), False))
+      return
+
+    item = supercuts[index]
+    if 'st3' in item and index == len(supercuts)-1:
+      for numCuts in self.scan_pivots(events, index, base): yield numCuts
+      return
+
+    stride = grid.strides[index]
+    exhausted = False
+    scanned = {}
+    for local in self.orders[index]:
+      start, stop = base + local*stride, base + (local+1)*stride
+      # the cuts outside of this shard are left to the other shards
+      if stop <= grid.start or start >= grid.stop: continue
+      if 'st3' in item: item['pivot'] = self.pivots[index][local]
+      if classes[index] is not None:
+        pivot_class = classes[index][item['pivot']]
+        if pivot_class in scanned:
+          # an equivalent pivot was already scanned, copy its results over
+          yield self.copy(scanned[pivot_class], start, stop)
+          continue
+        # only results that were completely filled in can be copied
+        if start >= grid.start and stop <= grid.stop: scanned[pivot_class] = start
+      if not exhausted:
+        subevents = self.select(events, index)
+        if self.count(subevents) >= self.prune_below:
+          for numCuts in self.scan(subevents, index+1, start): yield numCuts
+          continue
+        # pivots are loosest first, so every pivot after this one keeps even fewer events
+        exhausted = self.monotone[index]
+      # adding more cuts only removes events, so record everything built on this in bulk
+      yield self.fill(start, stop, (0.0, 0.0, True))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import heapq
+
+from . import utils
+
+import logging
+logger = logging.getLogger(__name__)
+
+#@echo(write=logger.debug)
+def get_costs(dids, tree_name, numCuts):
+  ''' How long each DID takes to cut, in units of (entry x cut)
+        - every cut of the grid is applied to every entry, so this is what the time scales with
+        - the entries come from the index in use (see `index.use_index`), any file that is not in it is opened
+  '''
+  return dict((did, utils.get_entries(tree_name, files)*numCuts) for did, files in dids.items())
+
+#@echo(write=logger.debug)
+def get_jobs(dids, costs, numCuts, numWorkers, split=False):
+  ''' Turn the DIDs into jobs (did, files, shard) for the workers
+        - shard is None for the whole grid, or the (start, stop) of the cuts of the grid the job applies
+        - with split, a DID that costs more than an equal share of the work of each worker is split into
+          shards of the grid, so that it cannot hold up the rest of the run by itself
+  '''
+  share = float(sum(costs.values()))/max(numWorkers, 1)
+  jobs = []
+  for did, files in dids.items():
+    numShards = min(int(-(-costs[did]//share)), numWorkers, numCuts) if split and share else 1
+    if numShards <= 1:
+      jobs.append((did, files, None))
+      continue
+    bounds = [numCuts*shard//numShards for shard in range(numShards+1)]
+    jobs.extend((did, files, (start, stop)) for start, stop in zip(bounds[:-1], bounds[1:]))
+  return jobs
+
+#@echo(write=logger.debug)
+def fit_jobs(jobs, footprint, budget, numCuts, numWorkers):
+  ''' Split the jobs into smaller shards of the grid until each fits in an equal share of the memory budget of the workers
+        - footprint(job) is the bytes a job takes while it runs (see `plan.get_footprint`)
+        - every shard of a DID reads in all of its events, only the counts get smaller, so a job is only split in two
+          while that saves at least a tenth of the share
+  '''
+  share = float(budget)/max(numWorkers, 1)
+  fitted = []
+  pending = list(reversed(jobs))
+  while pending:
+    job = pending.pop()
+    did, files, shard = job
+    start, stop = shard or (0, numCuts)
+    halves = [(did, files, (start, (start+stop)//2)), (did, files, ((start+stop)//2, stop))]
+    if footprint(job) > share and stop - start > 1 and footprint(job) - footprint(halves[0]) >= share/10.:
+      pending.extend(reversed(halves))
+    else:
+      fitted.append(job)
+  return fitted
+
+def get_job_cost(job, costs, numCuts):
+  did, files, shard = job
+  if shard is None: return costs[did]
+  return costs[did]*(shard[1]-shard[0])//max(numCuts, 1)
+
+#@echo(write=logger.debug)
+def schedule(jobs, costs, numCuts, numWorkers):
+  ''' Longest processing time first: hand the most expensive job left to the worker with the least work so far
+        - returns the jobs of each worker, each list with the most expensive job first, and the work of each worker
+        - the run takes as long as the busiest worker, which is at most 4/3 of the best possible split
+  '''
+  order = sorted(jobs, key=lambda job: get_job_cost(job, costs, numCuts), reverse=True)
+  workers = [[] for worker in range(numWorkers)]
+  loads = [(0, worker) for worker in range(numWorkers)]
+  for job in order:
+    load, worker = heapq.heappop(loads)
+    workers[worker].append(job)
+    heapq.heappush(loads, (load + get_job_cost(job, costs, numCuts), worker))
+  work = [0]*numWorkers
+  for load, worker in loads: work[worker] = load
+  return workers, work
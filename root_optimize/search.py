@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import heapq
+
+from .grid import CutGrid
+from .scan import get_pivots, get_pivots_loosest_first
+
+import logging
+logger = logging.getLogger(__name__)
+
+#@echo(write=logger.debug)
+def find_top_cuts(supercuts, signal_data, total_bkgd, get_upper_bound, get_sig_dict, k):
+  ''' Best-first search for the top k cuts of a signal point over the grid of the supercuts
+        - a region of the grid is a range of pivots (loosest to tightest) for every supercut
+        - for monotone supercuts, the loosest corner of a region keeps the most signal and the
+          tightest corner keeps the least background, so get_upper_bound(signal counts, bkgd counts)
+          bounds the significance of every cut in the region
+        - regions that cannot beat the current k-th best cut are discarded without being evaluated
+        - get_sig_dict(cuthash, counts_dict) computes the significances of a single cut
+
+      Ties are broken the same way as sorting all of signal_data, so this returns exactly the top k
+      of the exhaustive scan as long as the event weights are not negative.
+  '''
+  grid = CutGrid(supercuts)
+  # for every supercut with pivots, its stride in the grid and the position of its pivots from loosest to tightest
+  axes = []
+  for item, stride in zip(grid.supercuts, grid.strides):
+    if 'st3' not in item: continue
+    local = dict((pivot, index) for index, pivot in enumerate(get_pivots(item)))
+    pivots, monotone = get_pivots_loosest_first(item)
+    axes.append((stride, [local[pivot] for pivot in pivots], monotone))
+
+  # the exhaustive scan is a stable sort of the signal file
+  positions = dict((cuthash, position) for position, cuthash in enumerate(signal_data))
+
+  def get_hash(indices):
+    return grid.get_hash(sum(stride*pivots[index] for (stride, pivots, monotone), index in zip(axes, indices)))
+
+  def get_bound(region):
+    # without a direction, a region is only bounded once it is a single pivot
+    if any(lo != hi and not monotone for (lo, hi), (stride, pivots, monotone) in zip(region, axes)): return float('inf')
+    sig_counts = signal_data.get(get_hash([lo for lo, hi in region]))
+    if sig_counts is None: return float('inf')
+    bkgd_counts = total_bkgd.get(get_hash([hi for lo, hi in region]), {'raw': 0., 'weighted': 0., 'scaled': 0.})
+    return get_upper_bound(sig_counts, bkgd_counts)
+
+  # top is a min-heap of the best cuts found so far, so top[0] is the k-th best
+  top = []
+  regions = [(-float('inf'), 0, tuple((0, len(pivots)-1) for stride, pivots, monotone in axes))]
+  numRegions = 1
+  numEvaluated = 0
+  while regions:
+    bound, _, region = heapq.heappop(regions)
+    # equal bounds can still win on the tie-break, so only stop on strictly worse ones
+    if len(top) == k and -bound < top[0][0][0]: break
+
+    if all(lo == hi for lo, hi in region):
+      cuthash = get_hash([lo for lo, hi in region])
+      if cuthash not in positions: continue
+      sig_dict = get_sig_dict(cuthash, signal_data[cuthash])
+      numEvaluated += 1
+      candidate = ((sig_dict['significance_scaled'], -positions[cuthash]), cuthash, sig_dict)
+      if len(top) < k:
+        heapq.heappush(top, candidate)
+      elif candidate[0] > top[0][0]:
+        heapq.heapreplace(top, candidate)
+      continue
+
+    # split the widest range, making sure ranges without a direction get split first
+    axis = max(range(len(region)), key=lambda i: (region[i][0] != region[i][1] and not axes[i][2], region[i][1] - region[i][0]))
+    lo, hi = region[axis]
+    mid = (lo + hi)//2
+    for half in ((lo, mid), (mid+1, hi)):
+      subregion = region[:axis] + (half,) + region[axis+1:]
+      heapq.heappush(regions, (-get_bound(subregion), numRegions, subregion))
+      numRegions += 1
+
+  logger.info("\t\tEvaluated {0:d} of {1:d} cuts".format(numEvaluated, len(signal_data)))
+  return [sig_dict for key, cuthash, sig_dict in sorted(top, reverse=True)]
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import ast
+import re
+import string
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the ROOT spellings of the logical operators, turned into python ones with the same (low) precedence before parsing
+root_ops = [(re.compile('&&'), ' and '), (re.compile(r'\|\|'), ' or '), (re.compile('!(?!=)'), ' not ')]
+# names that are not branches
+constants = ('True', 'False', 'None')
+# functions that only ever grow with their argument
+increasing_functions = ('sqrt', 'exp', 'expm1', 'log', 'log10', 'log1p', 'arctan', 'arcsinh', 'sinh', 'tanh')
+# how functions are spelled for ROOT, if it is not the same as for numexpr
+cpp_functions = {'abs': 'std::abs', 'arcsin': 'asin', 'arccos': 'acos', 'arctan': 'atan', 'arctan2': 'atan2',
+                 'arcsinh': 'asinh', 'arccosh': 'acosh', 'arctanh': 'atanh'}
+
+binary_ops = {ast.Add: ('+', '+'), ast.Sub: ('-', '-'), ast.Mult: ('*', '*'), ast.Div: ('/', '/'), ast.Mod: ('%', '%'),
+              ast.BitAnd: ('&', '&&'), ast.BitOr: ('|', '||'), ast.BitXor: ('^', '^')}
+compare_ops = {ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==', ast.NotEq: '!='}
+unary_ops = {ast.USub: ('-', '-'), ast.UAdd: ('+', '+'), ast.Invert: ('~', '!'), ast.Not: ('~', '!')}
+bool_ops = {ast.And: ast.BitAnd, ast.Or: ast.BitOr}
+
+def pivot_name(index):
+  return '__pivot{0:d}'.format(index)
+
+def get_name(node):
+  ''' the (dotted) name of a Name or Attribute node, or None for anything else '''
+  if isinstance(node, ast.Name): return node.id
+  if isinstance(node, ast.Attribute):
+    name = get_name(node.value)
+    return None if name is None else '{0:s}.{1:s}'.format(name, node.attr)
+  return None
+
+def get_constant(node):
+  ''' the value of a number, or None for anything else '''
+  if type(node).__name__ in ('Num', 'Constant'):
+    value = node.value if hasattr(node, 'value') else node.n
+    if isinstance(value, (int, float)) and not isinstance(value, bool): return value
+  if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+    value = get_constant(node.operand)
+    return None if value is None else -value
+  return None
+
+def combine(*signs):
+  ''' combine the ways the parts of an expression change: None if they disagree or are unknown '''
+  if None in signs: return None
+  signs = set(signs) - set([0])
+  if len(signs) > 1: return None
+  return signs.pop() if signs else 0
+
+def is_boolean(node):
+  if isinstance(node, (ast.Compare, ast.BoolOp)): return True
+  if isinstance(node, ast.UnaryOp): return isinstance(node.op, (ast.Invert, ast.Not)) and is_boolean(node.operand)
+  if isinstance(node, ast.BinOp): return isinstance(node.op, (ast.BitAnd, ast.BitOr, ast.Mult)) and is_boolean(node.left) and is_boolean(node.right)
+  return False
+
+class Selection(object):
+  ''' A supercut selection (`met > {0}`), parsed once into a python AST
+        - `branches` are the branches it reads, without the functions and pivots
+        - `directions` says for each pivot which way the cut tightens: 1 if a larger pivot is tighter,
+          -1 if a smaller pivot is tighter and 0 if it cannot be told (or the pivot is not used)
+        - `to_numexpr()` and `to_cpp()` write it back out for numexpr, or for ROOT (TTree::Draw, RDataFrame),
+          with `{0}`, `{1}`, ... for the pivots, so they can be formatted like the selection itself
+
+      Both the numexpr (`&`, `|`, `~`) and the ROOT (`&&`, `||`, `!`) spellings of the logical operators are
+      understood. A SyntaxError is raised for selections python cannot parse.
+  '''
+  def __init__(self, selection_string):
+    self.selection_string = selection_string
+    fields = [field for text, field, spec, conversion in string.Formatter().parse(selection_string) if field is not None]
+    self.numPivots = max([int(field)+1 for field in fields if field.isdigit()] + [len([field for field in fields if not field])])
+    self.pivots = dict((pivot_name(index), index) for index in range(self.numPivots))
+
+    source = selection_string.format(*[pivot_name(index) for index in range(self.numPivots)])
+    for regex, op in root_ops: source = regex.sub(op, source)
+    self.tree = ast.parse(source.strip(), mode='eval').body
+
+    self.branches = []
+    self._find_branches(self.tree)
+    self.directions = []
+    for index in range(self.numPivots):
+      sign = self._get_sign(self.tree, pivot_name(index))
+      # the cut keeps fewer events as the pivot grows if it is true less often
+      self.directions.append(-sign if sign else 0)
+
+  def _find_branches(self, node):
+    name = get_name(node)
+    if name is not None:
+      if name not in self.pivots and name not in constants and name not in self.branches: self.branches.append(name)
+      return
+    for child in ast.iter_child_nodes(node):
+      # the name of a function is not a branch
+      if isinstance(node, ast.Call) and child is node.func: continue
+      self._find_branches(child)
+
+  def _get_sign(self, node, pivot):
+    ''' whether the expression grows (1), shrinks (-1) or stays the same (0) as the pivot grows, None if unknown
+          - for a boolean expression, growing means being true for more events
+    '''
+    name = get_name(node)
+    if name is not None: return 1 if name == pivot else 0
+    if get_constant(node) is not None: return 0
+    if type(node).__name__ in ('Num', 'Constant', 'NameConstant', 'Str'): return 0
+
+    if isinstance(node, ast.UnaryOp):
+      sign = self._get_sign(node.operand, pivot)
+      if isinstance(node.op, ast.UAdd) or sign is None: return sign
+      return -sign
+    if isinstance(node, ast.BoolOp):
+      return combine(*(self._get_sign(value, pivot) for value in node.values))
+    if isinstance(node, ast.BinOp):
+      left, right = self._get_sign(node.left, pivot), self._get_sign(node.right, pivot)
+      if isinstance(node.op, ast.Add): return combine(left, right)
+      if isinstance(node.op, ast.Sub): return combine(left, None if right is None else -right)
+      # `(a > {0}) & (b > 2)` keeps fewer events as soon as one side does
+      if is_boolean(node): return combine(left, right)
+      if isinstance(node.op, (ast.Mult, ast.Div)):
+        if left == 0 and right == 0: return 0
+        # scaling by a number keeps (or flips) the direction
+        factor = get_constant(node.right)
+        if factor is not None and left is not None: return left if factor > 0 else (-left if factor < 0 else 0)
+        factor = get_constant(node.left)
+        if factor is not None and right is not None and isinstance(node.op, ast.Mult): return right if factor > 0 else (-right if factor < 0 else 0)
+        return None
+      return 0 if left == 0 and right == 0 else None
+    if isinstance(node, ast.Compare):
+      if len(node.ops) != 1: return combine(*(self._get_sign(compare, pivot) for compare in self._split_compare(node)))
+      left, right = self._get_sign(node.left, pivot), self._get_sign(node.comparators[0], pivot)
+      if left == 0 and right == 0: return 0
+      if left is None or right is None: return None
+      op = type(node.ops[0])
+      if op in (ast.Gt, ast.GtE): return combine(left, -right)
+      if op in (ast.Lt, ast.LtE): return combine(-left, right)
+      return None
+    if isinstance(node, ast.Call):
+      signs = [self._get_sign(arg, pivot) for arg in node.args]
+      if all(sign == 0 for sign in signs): return 0
+      if get_name(node.func) in increasing_functions and len(signs) == 1: return signs[0]
+      return None
+    return 0 if all(self._get_sign(child, pivot) == 0 for child in ast.iter_child_nodes(node)) else None
+
+  def _split_compare(self, node):
+    ''' `a < b < c` is `(a < b) & (b < c)` '''
+    operands = [node.left] + list(node.comparators)
+    return [ast.Compare(left=left, ops=[op], comparators=[right]) for left, op, right in zip(operands[:-1], node.ops, operands[1:])]
+
+  def _to_source(self, node, cpp):
+    name = get_name(node)
+    if name is not None:
+      if name in self.pivots: return '{{{0:d}}}'.format(self.pivots[name])
+      if name in ('True', 'False') and cpp: return name.lower()
+      return name
+    if type(node).__name__ in ('Num', 'Constant', 'NameConstant'):
+      value = node.value if hasattr(node, 'value') else node.n
+      if isinstance(value, bool) and cpp: return repr(value).lower()
+      return repr(value)
+    if isinstance(node, ast.BinOp):
+      if isinstance(node.op, ast.Pow):
+        if cpp: return 'pow({0:s}, {1:s})'.format(self._to_source(node.left, cpp), self._to_source(node.right, cpp))
+        return '({0:s}**{1:s})'.format(self._to_source(node.left, cpp), self._to_source(node.right, cpp))
+      if type(node.op) in binary_ops:
+        # `&` and `|` are only logical in C++ if both sides are true or false
+        op = binary_ops[type(node.op)][cpp and is_boolean(node)]
+        return '({0:s} {1:s} {2:s})'.format(self._to_source(node.left, cpp), op, self._to_source(node.right, cpp))
+    if isinstance(node, ast.BoolOp):
+      op = binary_ops[bool_ops[type(node.op)]][cpp]
+      return '({0:s})'.format(' {0:s} '.format(op).join(self._to_source(value, cpp) for value in node.values))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in unary_ops:
+      return '({0:s}{1:s})'.format(unary_ops[type(node.op)][cpp], self._to_source(node.operand, cpp))
+    if isinstance(node, ast.Compare):
+      if len(node.ops) != 1:
+        op = binary_ops[ast.BitAnd][cpp]
+        return '({0:s})'.format(' {0:s} '.format(op).join(self._to_source(compare, cpp) for compare in self._split_compare(node)))
+      if type(node.ops[0]) in compare_ops:
+        return '({0:s} {1:s} {2:s})'.format(self._to_source(node.left, cpp), compare_ops[type(node.ops[0])], self._to_source(node.comparators[0], cpp))
+    if isinstance(node, ast.Call) and get_name(node.func) is not None and not node.keywords:
+      function = get_name(node.func)
+      args = [self._to_source(arg, cpp) for arg in node.args]
+      if cpp and function == 'where' and len(args) == 3: return '({0:s} ? {1:s} : {2:s})'.format(*args)
+      return '{0:s}({1:s})'.format(cpp_functions.get(function, function) if cpp else function, ', '.join(args))
+    if isinstance(node, ast.Subscript):
+      index = node.slice.value if type(node.slice).__name__ == 'Index' else node.slice
+      return '{0:s}[{1:s}]'.format(self._to_source(node.value, cpp), self._to_source(index, cpp))
+    raise ValueError('Cannot write out `{0:s}` of the selection {1:s}'.format(ast.dump(node), self.selection_string))
+
+  def to_numexpr(self):
+    return self._to_source(self.tree, False)
+
+  def to_cpp(self):
+    return self._to_source(self.tree, True)
+
+#@echo(write=logger.debug)
+def get_branches(supercuts, eventWeightBranch=None):
+  ''' All of the branches used by the supercuts (and the event weight), raises a SyntaxError if one cannot be parsed '''
+  branches = []
+  selections = [supercut['selections'] for supercut in supercuts] + ([eventWeightBranch] if eventWeightBranch else [])
+  for selection in selections:
+    try:
+      branches.extend(branch for branch in Selection(selection).branches if branch not in branches)
+    except SyntaxError as e:
+      raise SyntaxError('Could not parse the selection `{0:s}`: {1}'.format(selection, e))
+  return branches
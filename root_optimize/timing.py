@@ -4,10 +4,29 @@
 
 
 import atexit
+import collections
+import contextlib
+import json
+import os
+import sys
 from time import time
 import logging
 from functools import reduce
 
+# wall time, CPU time of the whole process and CPU time of the current thread, with fallbacks for older pythons
+try:
+    from time import perf_counter as wall_clock
+except ImportError:
+    wall_clock = time
+try:
+    from time import process_time as cpu_clock
+except ImportError:
+    from time import clock as cpu_clock
+try:
+    from time import thread_time as thread_clock
+except ImportError:
+    thread_clock = cpu_clock
+
 logger = logging.getLogger("root_optimize.timing")
 logger.setLevel(10) # we use info
 print = logger.info
@@ -26,15 +45,168 @@ def log(s, elapsed=None):
     print(line)
     print("")
 
+start_time = time()
+
 def endlog():
     end = time()
-    elapsed = end-start
+    elapsed = end-start_time
     print("")
     log("End Program", secondsToStr(elapsed))
 
 def now():
     return secondsToStr(time())
 
-start = time()
-atexit.register(endlog)
-log("Start Program")
+def start():
+    ''' log the start of the program now, and the time it took when it exits '''
+    global start_time
+    start_time = time()
+    atexit.register(endlog)
+    log("Start Program")
+
+def get_peak_rss():
+    ''' the most memory this process has used so far, in MB, or None if it cannot be told '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak/1024.**(2 if sys.platform == 'darwin' else 1)
+
+def get_rss():
+    ''' the memory this process uses right now, in MB, or the most it has used so far if that cannot be told '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1024.**2
+    except (IOError, OSError, ValueError, AttributeError):
+        return get_peak_rss()
+
+class Timer(object):
+    ''' Records the wall and CPU time spent in each phase of a job, and how much work it did
+          - `with timer.phase('tree2array'):` adds the time spent in the block to that phase
+          - `timer.count(events=...)` adds to the counts used for the rates in the report
+          - `cpu` is the CPU time of the whole process, so it has the threads of numexpr and of the numba
+            kernels, but also whatever else runs in the process at the same time (the prefetching thread,
+            or the other jobs with the thread backend)
+          - `thread_cpu` is the CPU time of the thread running the phase alone
+          - a phase with a lot less `cpu` than wall time was waiting (on I/O, or on memory to free up), one
+            with a lot less `thread_cpu` than `cpu` handed its work to other threads
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.phases = collections.OrderedDict()
+        self.counts = collections.defaultdict(int)
+        self.peak_rss = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall, cpu, thread_cpu = wall_clock(), cpu_clock(), thread_clock()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, {'wall': 0., 'cpu': 0., 'thread_cpu': 0.})
+            phase['wall'] += wall_clock() - wall
+            phase['cpu'] += cpu_clock() - cpu
+            phase['thread_cpu'] += thread_clock() - thread_cpu
+            self.peak_rss = get_peak_rss()
+
+    def count(self, **counts):
+        for key, value in counts.items(): self.counts[key] += value
+
+    def merge(self, other):
+        ''' add the phases and counts of another timer (eg: of another shard of the same DID) '''
+        for name, other_phase in other.phases.items():
+            phase = self.phases.setdefault(name, {'wall': 0., 'cpu': 0., 'thread_cpu': 0.})
+            phase['wall'] += other_phase['wall']
+            phase['cpu'] += other_phase['cpu']
+            phase['thread_cpu'] += other_phase['thread_cpu']
+        self.count(**other.counts)
+        peak_rss = [peak_rss for peak_rss in (self.peak_rss, other.peak_rss) if peak_rss is not None]
+        self.peak_rss = max(peak_rss) if peak_rss else None
+        return self
+
+    @property
+    def wall(self):
+        return sum(phase['wall'] for phase in self.phases.values())
+
+    @property
+    def cpu(self):
+        return sum(phase['cpu'] for phase in self.phases.values())
+
+    @property
+    def thread_cpu(self):
+        return sum(phase['thread_cpu'] for phase in self.phases.values())
+
+    def get_rate(self, count, *phases):
+        ''' how many of count per second of wall time spent in the phases '''
+        wall = sum(self.phases[phase]['wall'] for phase in phases if phase in self.phases)
+        return self.counts[count]/wall if count in self.counts and wall > 0 else None
+
+    def to_dict(self):
+        phases = collections.OrderedDict()
+        for name, phase in self.phases.items():
+            phases[name] = {'wall': phase['wall'], 'cpu': phase['cpu'], 'thread_cpu': phase['thread_cpu'],
+                            'cpu_fraction': phase['cpu']/phase['wall'] if phase['wall'] > 0 else None}
+        return collections.OrderedDict([('name', self.name),
+                                        ('wall', self.wall),
+                                        ('cpu', self.cpu),
+                                        ('thread_cpu', self.thread_cpu),
+                                        ('phases', phases),
+                                        ('counts', dict(self.counts)),
+                                        ('events_per_second', self.get_rate('events', *io_phases)),
+                                        ('cuts_per_second', self.get_rate('cuts', 'scan')),
+                                        ('peak_rss_mb', self.peak_rss)])
+
+# the phases spent reading in the events
+io_phases = ('chain', 'branches', 'tree2array', 'skim')
+
+def write_report(filename, timers, **info):
+    ''' write the timers of every job, and what is in info about the run, to a json file '''
+    report = collections.OrderedDict(sorted(info.items()))
+    report['wall'] = sum(timer.wall for timer in timers)
+    report['cpu'] = sum(timer.cpu for timer in timers)
+    report['io_wall'] = sum(timer.phases[phase]['wall'] for timer in timers for phase in io_phases if phase in timer.phases)
+    report['jobs'] = [timer.to_dict() for timer in timers]
+    with open(filename, 'w+') as f:
+        f.write(json.dumps(report, indent=4))
+    return report
+
+@contextlib.contextmanager
+def profile(filename):
+    ''' run the block under cProfile and dump the statistics to filename, or just run it if filename is None
+          - only one profiler can run at a time in newer pythons, so with the thread backend some of the
+            jobs might not be profiled
+    '''
+    if filename is None:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        logger.warning("Not profiling {0:s}: {1}".format(filename, e))
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+
+def merge_profiles(filenames, output, sort_by='cumulative', num_functions=40):
+    ''' merge the profiles of the jobs into output (a .prof file readable by pstats or snakeviz), and write
+        the hottest functions as text next to it
+          - returns the name of the text report
+    '''
+    import pstats
+    filenames = [filename for filename in filenames if os.path.isfile(filename)]
+    if not filenames: return None
+    stats = pstats.Stats(filenames[0])
+    for filename in filenames[1:]: stats.add(filename)
+    stats.dump_stats(output)
+    report = '{0:s}.txt'.format(os.path.splitext(output)[0])
+    with open(report, 'w+') as f:
+        stats.stream = f
+        stats.strip_dirs().sort_stats(sort_by).print_stats(num_functions)
+    return report
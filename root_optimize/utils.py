@@ -3,10 +3,8 @@
 
 
 
-import ROOT
 import collections
 from functools import reduce
-ROOT.PyConfig.IgnoreCommandLineOptions = True
 
 import csv
 import copy
@@ -15,15 +13,24 @@ import json
 import fnmatch
 import hashlib
 import itertools
+import multiprocessing
 import numpy as np
 import numexpr as ne
 import os
 import sys
-from time import clock
 import tqdm
+from . import timing
 import contextlib
+import threading
+import traceback
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 
-import root_numpy as rnp
+# ROOT and root_numpy are only imported once they are used
+from .lazy import ROOT
+from .lazy import root_numpy as rnp
 
 import logging
 logger = logging.getLogger(__name__)
@@ -199,7 +206,17 @@ def get_scaleFactor(weights, did):
   return scaleFactor
 
 #@echo(write=logger.debug)
-def get_significance(signal, bkgd, insignificanceThreshold, bkgdUncertainty, bkgdStatUncertainty, rawBkgd):
+def binomial_exp_z(signal, bkgd, relativeBkgdUncertainty):
+  ''' The same as ROOT.RooStats.NumberCountingUtils.BinomialExpZ, computed with scipy so ROOT is not needed
+        - the p-value is the regularized incomplete beta function of the on/off problem, turned into
+          a one-sided gaussian significance
+  '''
+  from scipy.special import betainc, ndtri
+  tau = 1./bkgd/(relativeBkgdUncertainty*relativeBkgdUncertainty)
+  pvalue = betainc(signal+bkgd, bkgd*tau+1, 1./(1.+tau))
+  return float(-ndtri(pvalue))
+
+def get_significance(signal, bkgd, insignificanceThreshold, bkgdUncertainty, bkgdStatUncertainty, rawBkgd, method='root'):
   # if not enough events, return string of which one did not have enough
   if signal < insignificanceThreshold:
     #sigDetails['insignificance'] = "signal"
@@ -212,28 +229,38 @@ def get_significance(signal, bkgd, insignificanceThreshold, bkgdUncertainty, bkg
     sig = -3
   else:
     # otherwise, calculate!
-    sig = ROOT.RooStats.NumberCountingUtils.BinomialExpZ(signal, bkgd, bkgdUncertainty)
+    if method == 'scipy':
+      sig = binomial_exp_z(signal, bkgd, bkgdUncertainty)
+    else:
+      sig = ROOT.RooStats.NumberCountingUtils.BinomialExpZ(signal, bkgd, bkgdUncertainty)
   return sig
 
 #@echo(write=logger.debug)
 def get_ttree(tree_name, filenames, eventWeightBranch):
   # this is a dict that holds the tree
 
+  from .index import get_metadata
   logger.info("Initializing TChain: {0}".format(tree_name))
   # start by making a TChain
   tree = ROOT.TChain(tree_name)
-  for fname in filenames:
+  metadata = [get_metadata(fname, tree_name) for fname in filenames]
+  for fname, fmetadata in zip(filenames, metadata):
     if not os.path.isfile(fname):
       raise ValueError('The supplied input file `{0}` does not exist or I cannot find it.'.format(fname))
     else:
       logger.info("\tAdding {0}".format(fname))
-      tree.Add(fname)
+      # with the entries from the index, ROOT does not have to open the file to know them
+      if fmetadata is None: tree.Add(fname)
+      else: tree.Add(fname, fmetadata['entries'])
 
-    # Print some information
-    logger.info('\tNumber of input events: %s' % tree.GetEntries())
+  # Print some information, this opens every file that is not in the index
+  logger.info('\tNumber of input events: %s' % tree.GetEntries())
 
   # make sure the branches are compatible between the two
-  branches = set(i.GetName() for i in tree.GetListOfBranches())
+  if metadata and metadata[0] is not None:
+    branches = set(metadata[0]['branches'])
+  else:
+    branches = set(i.GetName() for i in tree.GetListOfBranches())
 
   # user can pass in a selection for the branch
   for ewBranch in selection_to_branches(eventWeightBranch, tree):
@@ -242,6 +269,23 @@ def get_ttree(tree_name, filenames, eventWeightBranch):
 
   return tree
 
+# the number of entries of (tree_name, files), the scheduler asks for them before anything is read in
+_entries = {}
+
+#@echo(write=logger.debug)
+def get_entries(tree_name, filenames):
+  ''' the number of entries in the tree across all of the files, cached, only the headers of the files are read '''
+  from .index import get_metadata
+  key = (tree_name, tuple(filenames))
+  metadata = [get_metadata(fname, tree_name) for fname in filenames]
+  if key not in _entries and all(fmetadata is not None for fmetadata in metadata):
+    _entries[key] = sum(fmetadata['entries'] for fmetadata in metadata)
+  if key not in _entries:
+    chain = ROOT.TChain(tree_name)
+    for fname in filenames: chain.Add(fname)
+    _entries[key] = int(chain.GetEntries())
+  return _entries[key]
+
 #@echo(write=logger.debug)
 def cut_to_selection(cut):
   return cut['selections'].format(*cut['pivot'])
@@ -254,11 +298,134 @@ alphachars = re.compile('\W+')
 #@echo(write=logger.debug)
 def selection_to_branches(selection_string, tree):
   global alphachars
+  from .selection import Selection
+  try:
+    return Selection(selection_string).branches
+  except SyntaxError:
+    logger.debug("Could not parse {0:s}, guessing its branches instead".format(selection_string))
   # filter out all selection criteria
   raw_branches = [_f for _f in alphachars.sub(' ', selection_string.format(*['-']*10)).split(' ') if _f]
   # filter out those that are just numbers in string
   return [branch for branch in raw_branches if not branch.isdigit()]
 
+threshold_regex = re.compile('^\s*(?P<lhs>[^<>=]+?)\s*(?P<op>[<>]=?)\s*(?P<rhs>[^<>=]+?)\s*$')
+flipped_ops = {'>': '<', '>=': '<=', '<': '>', '<=': '>='}
+pivot_regex = re.compile('^\{(\d+)\}$')
+def _split_threshold(selection_string):
+  ''' split `expression op {i}` (or `{i} op expression`) into (expression, op, i) '''
+  global threshold_regex, flipped_ops, pivot_regex
+  m = threshold_regex.match(selection_string)
+  if m is None: return None
+  lhs, op, rhs = m.group('lhs'), m.group('op'), m.group('rhs')
+  if pivot_regex.match(rhs) and '{' not in lhs: return lhs, op, int(rhs[1:-1])
+  if pivot_regex.match(lhs) and '{' not in rhs: return rhs, flipped_ops[op], int(lhs[1:-1])
+  return None
+
+#@echo(write=logger.debug)
+def get_threshold(selection_string):
+  ''' Given a selection with a single pivot, split it up as `expression op {0}`
+        - returns (expression, op), flipping the op if the pivot was written first (`{0} < x`)
+        - returns None if the selection is not a simple threshold
+  '''
+  threshold = _split_threshold(selection_string)
+  if threshold is None or threshold[2] != 0: return None
+  return threshold[:2]
+
+#@echo(write=logger.debug)
+def get_window(selection_string):
+  ''' Given a selection like `(x > {0}) & (x < {1})`, split it up into its lower and upper bounds
+        - returns (expression, (lower op, lower pivot index), (upper op, upper pivot index))
+        - returns None if the selection is not a window on a single expression
+  '''
+  terms = selection_string.split('&')
+  if len(terms) != 2 or not all(terms): return None
+  bounds = []
+  for term in terms:
+    term = term.strip()
+    if term.startswith('(') and term.endswith(')'): term = term[1:-1]
+    bound = _split_threshold(term)
+    if bound is None: return None
+    bounds.append(bound)
+  # lower bound first
+  bounds.sort(key=lambda bound: not bound[1].startswith('>'))
+  (expression, lower_op, lower_index), (upper_expression, upper_op, upper_index) = bounds
+  if expression.strip() != upper_expression.strip() or not lower_op.startswith('>') or not upper_op.startswith('<') or lower_index == upper_index: return None
+  return expression, (lower_op, lower_index), (upper_op, upper_index)
+
+identifier_regex = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
+#@echo(write=logger.debug)
+def is_bare_comparison(selection_string):
+  ''' Whether a selection with its pivots filled in only compares branches to numbers, like `(met > 100.0) & (mj >= 4)`
+        - these come out the same in ROOT (in double precision) and in numexpr, which compares a float32
+          branch to a number in double precision too, but does arithmetic on it (`met/1000`) in float32
+  '''
+  global threshold_regex, identifier_regex
+  for term in selection_string.split('&'):
+    term = term.strip()
+    while term.startswith('(') and term.endswith(')'): term = term[1:-1].strip()
+    m = threshold_regex.match(term)
+    if m is None: return False
+    sides = [m.group('lhs').strip(), m.group('rhs').strip()]
+    numbers = 0
+    for side in sides:
+      try:
+        float(side)
+        numbers += 1
+      except ValueError:
+        pass
+    if numbers != 1 or not any(identifier_regex.match(side) for side in sides): return False
+  return True
+
+#@echo(write=logger.debug)
+def selection_direction(selection_string):
+  ''' Given a selection with a single pivot, figure out which way the cut tightens
+        - returns 1 if a larger pivot is tighter (`x > {0}`), -1 if a smaller pivot is tighter (`x < {0}`)
+        - this also works through and-ed cuts and scaling, eg: `(x/1000 > {0}) & (y > 2)` returns 1
+        - returns 0 if it cannot be told (eg: `abs(x - {0}) < 10`)
+  '''
+  from .selection import Selection
+  try:
+    selection = Selection(selection_string)
+  except SyntaxError:
+    return 0
+  return selection.directions[0] if selection.numPivots == 1 else 0
+
+#@echo(write=logger.debug)
+def get_missing_branches(tree_name, filename, branches):
+  ''' Open up a single file and list which of the branches are not in its tree, unless it is in the index '''
+  from .index import get_metadata
+  metadata = get_metadata(filename, tree_name)
+  if metadata is not None:
+    return [branch for branch in branches if branch not in metadata['branches'] and branch not in metadata['leaves']]
+  f = ROOT.TFile.Open(filename)
+  try:
+    tree = f.Get(tree_name) if f else None
+    if not tree: raise ValueError('Could not find the tree {0:s} in {1:s}'.format(tree_name, filename))
+    return [branch for branch in branches if not tree.GetBranch(branch) and not tree.GetLeaf(branch)]
+  finally:
+    if f: f.Close()
+
+#@echo(write=logger.debug)
+def get_branch_types(tree_name, filename, branches):
+  ''' Open up a single file and look up the type of the (first) leaf of each branch, eg: Float_t
+        - only the header of the file is read, no events, and not even that if it is in the index
+  '''
+  from .index import get_metadata
+  metadata = get_metadata(filename, tree_name)
+  if metadata is not None:
+    return dict((branch, metadata['leaves'][branch]) for branch in branches if branch in metadata['leaves'])
+  f = ROOT.TFile.Open(filename)
+  try:
+    tree = f.Get(tree_name) if f else None
+    if not tree: raise ValueError('Could not find the tree {0:s} in {1:s}'.format(tree_name, filename))
+    types = {}
+    for branch in branches:
+      leaf = tree.GetLeaf(branch)
+      if leaf: types[branch] = leaf.GetTypeName()
+    return types
+  finally:
+    if f: f.Close()
+
 #@echo(write=logger.debug)
 def tree_get_branches(tree, eventWeightBranch):
   return [i.GetName() for i in tree.GetListOfBranches() if not i.GetName() in eventWeightBranch]
@@ -294,7 +461,7 @@ def get_n_cuts(supercuts):
 
 #@echo(write=logger.debug)
 def get_cut_hash(cut):
-  return hashlib.md5(str([sorted(obj.items()) for obj in cut])).hexdigest()
+  return hashlib.md5(str([sorted(obj.items()) for obj in cut]).encode('utf-8')).hexdigest()
 
 #@echo(write=logger.debug)
 def apply_selection(tree, cuts, eventWeightBranch, canvas):
@@ -317,93 +484,490 @@ def apply_cut(arr, cut):
   return ne.evaluate(cut_to_selection(cut), local_dict=arr)
 
 #@echo(write=logger.debug)
-def apply_cuts(tree, cuts, eventWeightBranch, doNumpy=False, canvas=None):
-  if doNumpy:
+def apply_cuts(tree, cuts, eventWeightBranch, doNumpy=False, canvas=None, weights=None):
+  if doNumpy and weights is not None:
+    # the weights were evaluated once already (see `get_event_weights`), so only select on them
+    mask = ne.evaluate(cuts_to_selection(cuts), local_dict=tree)
+    events = weights[mask if mask.dtype == np.bool_ else mask!=0]
+    # only keep the events that pass, the count is the number of them and the sum is over their weights
+    #   (summing the compacted weights is what the numba engine does too, so both agree to the last bit)
+    events = events[events!=0]
+    return float(events.size), float(np.sum(events))
+  elif doNumpy:
     # here, the tree is an rnp.tree2array() np.array
     entireSelection = '{0:s}*{1:s}'.format(eventWeightBranch, cuts_to_selection(cuts))
     events = ne.evaluate(entireSelection, local_dict=tree)
     #events = tree[eventWeightBranch][reduce(np.bitwise_and, (apply_cut(tree, cut) for cut in cuts))]
-    # count number of events that pass, not summing the weights since `events!=0` returns a boolean array
-    return np.sum(events!=0).astype(float), np.sum(events).astype(float)
+    events = events[events!=0]
+    return float(events.size), float(np.sum(events))
   else:
     # here, the tree is a ROOT.TTree
     return apply_selection(tree, cuts, eventWeightBranch, canvas)
 
 #@echo(write=logger.debug)
-def do_cut(did, files, supercuts, weights, tree_name, output_directory, eventWeightBranch, doNumpy, pids):
+def get_narrowest_dtype(values, pivots=None):
+  ''' The narrowest dtype that keeps every cut on these values the same
+        - pivots are every value the branch is compared against, or None if it is used in arithmetic
+        - integers go to the smallest integer type that holds all of them, numexpr does arithmetic on
+          anything narrower than 32 bits in 32 bits, so 64-bit integers used in arithmetic stay as they are
+        - floats go to float32 only if they are just compared against the pivots, and every value is
+          exact in float32 or none of the pivots falls between a value and its rounding, since numexpr
+          does arithmetic on float32 in single precision
+  '''
+  if values.dtype.kind in 'iu' and values.size:
+    if pivots is None and values.dtype.itemsize > 4: return values.dtype
+    dtype = np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+    if dtype.itemsize < values.dtype.itemsize: return dtype
+  elif values.dtype.kind == 'f' and values.dtype.itemsize > 4 and pivots is not None:
+    rounded = values.astype(np.float32)
+    inexact = (rounded != values) & ~np.isnan(values)
+    if not np.any(inexact): return np.dtype(np.float32)
+    values, rounded = values[inexact], rounded[inexact].astype(values.dtype)
+    pivots = np.unique(np.asarray(pivots, dtype=np.float64))
+    # every comparison (<, <=, ==, ...) with every pivot comes out the same
+    if all(np.array_equal(np.searchsorted(pivots, values, side=side), np.searchsorted(pivots, rounded, side=side)) for side in ('left', 'right')):
+      return np.dtype(np.float32)
+  return values.dtype
+
+#@echo(write=logger.debug)
+def downcast_branches(arr, supercuts, eventWeightBranch):
+  ''' Store every branch of the array in the narrowest dtype that does not change any cut (see `get_narrowest_dtype`)
+        - floats can only be rounded if they are only used in thresholds or windows directly on the
+          branch (eg: `met > {0}`), where we know every value they are compared against
+        - the branches of the event weight are left alone, they are summed and not compared
+  '''
+  from .scan import get_bounds, get_pivots
+  # the pivots each branch is compared against, or None if it is used in any other way
+  pivots = dict((branch, []) for branch in arr.dtype.names)
+  weightBranches = selection_to_branches(eventWeightBranch, None)
+  for supercut in supercuts:
+    branches = selection_to_branches(supercut['selections'], None)
+    bounds = get_bounds(supercut if 'st3' in supercut else dict(supercut, st3=supercut['pivot']))
+    if bounds is not None and branches == [bounds[0].strip()] and pivots.get(branches[0]) is not None:
+      pivots[branches[0]].extend(np.ravel(get_pivots(supercut)) if 'st3' in supercut else supercut['pivot'])
+    else:
+      for branch in branches: pivots[branch] = None
+
+  dtype = [(branch, arr.dtype[branch] if branch in weightBranches else get_narrowest_dtype(arr[branch], pivots[branch])) for branch in arr.dtype.names]
+  downcast = arr.astype(dtype)
+  logger.info("Downcast {0:d} of {1:d} branches, using {2:0.1f} MB instead of {3:0.1f} MB ({4:0.2%} saved)".format(
+    sum(arr.dtype[branch] != downcast.dtype[branch] for branch in arr.dtype.names), len(arr.dtype.names),
+    downcast.nbytes/1024.**2, arr.nbytes/1024.**2, 1 - float(downcast.nbytes)/max(arr.nbytes, 1)))
+  for branch in arr.dtype.names:
+    if arr.dtype[branch] != downcast.dtype[branch]: logger.debug("\t{0:s}: {1} -> {2}".format(branch, arr.dtype[branch], downcast.dtype[branch]))
+  return downcast
+
+#@echo(write=logger.debug)
+def get_event_weights(arr, eventWeightBranch, scaleFactor=None):
+  ''' Evaluate the event weight (which can be an expression, eg: `weight_mc*weight_btag`) once for every event
+        - returns a float64 column, with the scale factor folded in if one is given
+  '''
+  weights = ne.evaluate(eventWeightBranch, local_dict=arr).astype(np.float64)
+  if scaleFactor is not None: weights *= scaleFactor
+  return weights
+
+#@echo(write=logger.debug)
+def apply_grid(tree, grid, eventWeightBranch, counts, canvas=None):
+  ''' Apply every cut of the grid one at a time with `apply_cuts`, filling in counts as it goes '''
+  for index, cut in enumerate(grid.iter_cuts()):
+    counts[index] = apply_cuts(tree, cut, eventWeightBranch, canvas=canvas) + (False,)
+    yield 1
+
+# the workers of the thread backend register in pids at the same time
+_positions_lock = threading.Lock()
+
+#@echo(write=logger.debug)
+def enable_thread_safety():
+  ''' let ROOT know that it is used from more than one thread '''
+  if hasattr(ROOT, 'ROOT') and hasattr(ROOT.ROOT, 'EnableThreadSafety'): ROOT.ROOT.EnableThreadSafety()
+
+#@echo(write=logger.debug)
+def get_numexpr_threads(numWorkers, backend):
+  ''' how many threads numexpr should use in each worker, so that together the workers use every core once
+        - the workers of the thread backend share the one thread pool of numexpr, which only evaluates one
+          expression at a time, so with more than one worker they each evaluate on their own thread instead
+  '''
+  numCores = ne.detect_number_of_cores()
+  if backend == 'threads' and numWorkers > 1: return 1
+  return max(1, numCores//max(numWorkers, 1))
+
+def setup_worker(index=None, numexpr_threads=None):
+  ''' Set up a worker the way the parent was set up before handing it a job
+        - joblib reuses its worker processes between calls, so a worker can be older than the environment
+          variables the parent set since (and numexpr only reads its number of threads when imported)
+        - index is the filename of the index in use (see `index.use_index`)
+  '''
+  if index is not None:
+    from .index import set_index
+    set_index(index)
+  if numexpr_threads is not None: ne.set_num_threads(numexpr_threads)
+
+class SharedTrees(object):
+  ''' Hands out the tree of a DID to every job that needs it, for the thread backend where the jobs share memory
+        - the tree is read in by the first job that asks for it, the others wait for it and use the same array
+        - it is let go once the last of the jobs took it
+  '''
+  def __init__(self, jobs):
+    self.remaining = collections.defaultdict(int)
+    for did, files, shard in jobs: self.remaining[did] += 1
+    self.trees = {}
+    self.locks = collections.defaultdict(threading.Lock)
+    self.lock = threading.Lock()
+
+  def get(self, did, load):
+    with self.lock: lock = self.locks[did]
+    with lock:
+      if did not in self.trees: self.trees[did] = load()
+      tree = self.trees[did]
+      self.remaining[did] -= 1
+      if self.remaining[did] <= 0: del self.trees[did]
+    return tree
+
+class MemoryGovernor(object):
+  ''' Keeps the projected footprint of the jobs running at once under a memory budget (bytes)
+        - a job reserves its footprint (from footprints, by job name) before it reads anything in, and gives it back
+          once its counts are written out
+        - it waits while it would go over the budget, or over the memory the machine has left, unless nothing else
+          is running, so a job that does not fit on its own still runs (by itself)
+        - with processes the reservations live in a multiprocessing manager, which the joblib workers can be handed
+  '''
+  def __init__(self, budget, footprints, processes=True):
+    self.budget = budget
+    self.footprints = footprints
+    self.manager = multiprocessing.Manager() if processes else None
+    self.condition = self.manager.Condition() if processes else threading.Condition()
+    self.reserved = self.manager.dict() if processes else {}
+
+  def __getstate__(self):
+    # the workers only need the proxies
+    return dict(self.__dict__, manager=None)
+
+  def fits(self, footprint):
+    from .plan import get_available_memory
+    available = get_available_memory()
+    return sum(self.reserved.values()) + footprint <= self.budget and (available is None or footprint <= available)
+
+  def acquire(self, name):
+    footprint = self.footprints.get(name, 0)
+    with self.condition:
+      while len(self.reserved) and not self.fits(footprint):
+        # the memory the machine has left changes without anyone letting us know
+        self.condition.wait(1.)
+      self.reserved[name] = footprint
+
+  def release(self, name):
+    with self.condition:
+      self.reserved.pop(name, None)
+      self.condition.notify_all()
+
+  def shutdown(self):
+    if self.manager is not None: self.manager.shutdown()
 
+#@echo(write=logger.debug)
+def get_position(pids):
+  ''' register this worker in pids and return its position, which is used to place its progress bar
+        - a worker is a process, or a thread of a process for the thread backend
+  '''
   position = -1
   if pids is not None:
-    # handle pid registration
-    if os.getpid() not in pids: pids[np.argmax(pids==0)] = os.getpid()
-    # this gives us the position of this particular process in our list of processes
-    position = np.where(pids==os.getpid())[0][0]
+    worker = hash((os.getpid(), threading.current_thread().ident)) & 0x7fffffffffffffff
+    with _positions_lock:
+      # handle pid registration
+      if worker not in pids: pids[np.argmax(pids==0)] = worker
+    # this gives us the position of this particular worker in our list of workers
+    position = np.where(pids==worker)[0][0]
+  return position
 
-  start = clock()
-  try:
-    # load up the tree for the files
+#@echo(write=logger.debug)
+def load_did(did, files, supercuts, tree_name, eventWeightBranch, doNumpy, downcast=False, timer=None):
+  ''' The I/O half of `do_cut`, read in the tree of a DID and skim it
+        - with doNumpy, this returns the rnp.tree2array() np.array of the tree, otherwise the ROOT.TChain
+        - the time spent in each phase goes to timer (a `timing.Timer`)
+  '''
+  from .scan import get_envelope, get_mask
+  if timer is None: timer = timing.Timer(did)
+  # load up the tree for the files
+  with timer.phase('chain'):
     tree = get_ttree(tree_name, files, eventWeightBranch)
-    # if using numpy optimization, load the tree as a numpy array to apply_cuts on
-    if doNumpy:
-      # this part is tricky, a user might specify multiple branches
-      #   in their selection string, so we will remove non-alphanumeric characters (underscores are safe)
-      #   and remove anything else that is an empty string (hence the filter)
-      #   and then flatten the entire list, removing duplicate branch names
-      '''
-        totalSelections = []
-        for supercut in supercuts:
-          selection = supercut['selections']
-          # filter out non-alphanumeric
-          selection = p.sub(' ', selection.format("-", "-", "-", "-", "-", "-", "-", "-", "-", "-"))
-          # split on spaces, since we substituted non alphanumeric with spaces
-          selections = selection.split(' ')
-          # remove empty elements
-          filter(None, selections)
-          totalSelections.append(selections)
-
-        # flatten the thing
-        totalSelections = itertools.chain.from_iterable(totalSelections)
-        # remove duplicates
-        totalSelections = list(set(totalSelections))
-      '''
+    numEvents = tree.GetEntries()
+
+  # no cut is looser than this, so events failing it never need to be looked at
+  envelope = get_envelope(supercuts)
+  skim = cuts_to_selection(envelope) if envelope else None
+  # if using numpy optimization, load the tree as a numpy array to apply_cuts on
+  if doNumpy:
+    # this part is tricky, a user might specify multiple branches
+    #   in their selection string, so we will remove non-alphanumeric characters (underscores are safe)
+    #   and remove anything else that is an empty string (hence the filter)
+    #   and then flatten the entire list, removing duplicate branch names
+    '''
+      totalSelections = []
+      for supercut in supercuts:
+        selection = supercut['selections']
+        # filter out non-alphanumeric
+        selection = p.sub(' ', selection.format("-", "-", "-", "-", "-", "-", "-", "-", "-", "-"))
+        # split on spaces, since we substituted non alphanumeric with spaces
+        selections = selection.split(' ')
+        # remove empty elements
+        filter(None, selections)
+        totalSelections.append(selections)
+
+      # flatten the thing
+      totalSelections = itertools.chain.from_iterable(totalSelections)
+      # remove duplicates
+      totalSelections = list(set(totalSelections))
+    '''
+    with timer.phase('branches'):
       branchesSpecified = list(set(itertools.chain.from_iterable(selection_to_branches(supercut['selections'], tree) for supercut in supercuts)))
       eventWeightBranchesSpecified = list(set(selection_to_branches(eventWeightBranch, tree)))
 
       # get actual list of branches in the file
       availableBranches = tree_get_branches(tree, eventWeightBranchesSpecified)
 
-      # remove anything that doesn't exist
-      branchesToUse = [branch for branch in branchesSpecified if branch in availableBranches]
-      branchesSkipped = list(set(branchesSpecified) - set(branchesToUse))
-      if branchesSkipped:
-        logger.info("The following branches have been skipped...")
-        for branch in branchesSkipped:
-          logger.info("\t{0:s}".format(branch))
-      tree = rnp.tree2array(tree, branches=eventWeightBranchesSpecified+branchesToUse)
+    # remove anything that doesn't exist
+    branchesToUse = [branch for branch in branchesSpecified if branch in availableBranches]
+    branchesSkipped = list(set(branchesSpecified) - set(branchesToUse))
+    if branchesSkipped:
+      logger.info("The following branches have been skipped...")
+      for branch in branchesSkipped:
+        logger.info("\t{0:s}".format(branch))
+    # ROOT evaluates the selection in double precision and numexpr does arithmetic on float32 branches in
+    # float32, so ROOT only skips the events that fail a bare comparison, which both agree on
+    pushdown = [cut for cut in envelope if is_bare_comparison(cut_to_selection(cut))]
+    with timer.phase('tree2array'):
+      try:
+        # let ROOT skip the events when reading them in
+        arr = rnp.tree2array(tree, branches=eventWeightBranchesSpecified+branchesToUse, selection=cuts_to_selection(pushdown) if pushdown else None)
+      except Exception:
+        logger.warning("ROOT could not read with the selection {0:s}, skimming after loading instead".format(cuts_to_selection(pushdown)))
+        arr = rnp.tree2array(tree, branches=eventWeightBranchesSpecified+branchesToUse)
+    # the rest of the skim is done by numexpr, the same way as the cuts
+    if envelope:
+      with timer.phase('mask'):
+        arr = arr[reduce(np.logical_and, (get_mask(arr, cut) for cut in envelope))]
+    # smaller columns take less memory and are faster to cut on
+    if downcast:
+      with timer.phase('downcast'):
+        arr = downcast_branches(arr, supercuts, eventWeightBranch)
+    numSkimmed = arr.size
+    tree = arr
+  elif envelope:
+    with timer.phase('skim'):
+      tree.Draw('>>skim{0:s}'.format(did), skim, 'entrylist')
+      entryList = ROOT.gDirectory.Get('skim{0:s}'.format(did))
+      tree.SetEntryList(entryList)
+    numSkimmed = entryList.GetN()
+  else:
+    numSkimmed = numEvents
+  timer.count(events=numEvents, skimmed=numSkimmed)
 
-    # get the scale factor
-    sample_scaleFactor = get_scaleFactor(weights, did)
+  if envelope:
+    logger.info("Skimmed on {0:s}".format(skim))
+    logger.info("\tKept {0:d} of {1:d} events (reduction factor {2:0.2f})".format(int(numSkimmed), int(numEvents), float(numEvents)/max(numSkimmed, 1)))
 
-    # build the containing canvas for all histograms drawn in `apply_selection`
-    canvas = ROOT.TCanvas('test{0:s}'.format(did), 'test{0:s}'.format(did), 200, 10, 100, 100)
+  return tree
 
-    # iterate over the cuts available
+#@echo(write=logger.debug)
+def cut_did(did, tree, supercuts, weights, output_directory, eventWeightBranch, doNumpy, position=-1, prune_below=None, sparse_below=0.05, doJIT=True, foldScaleFactor=False, shard=None, timer=None, metrics=None, signal_dids=None):
+  ''' The compute half of `do_cut`, apply every cut to the tree from `load_did` and write out the counts of the DID
+        - with shard, only the cuts of the grid from shard[0] up to shard[1] are applied, and written to the file
+          from `get_shard_filename`
+        - the time spent in each phase goes to timer (a `timing.Timer`)
+        - if signal_dids is given and the DID is not one of them, only the empty cuts are pruned whatever prune_below is
+  '''
+  from .scan import get_cut_classes, get_n_classes
+  from .grid import CutGrid
+  if timer is None: timer = timing.Timer(did)
+  # get the scale factor
+  sample_scaleFactor = get_scaleFactor(weights, did)
+  # it can only be folded into the weights if the weighted counts can be recovered
+  foldScaleFactor = foldScaleFactor and sample_scaleFactor != 0
+
+  grid = CutGrid(supercuts)
+  if shard is not None: grid = grid[shard[0]:shard[1]]
+  classes = None
+  eventWeights = None
+  if doNumpy:
+    with timer.phase('prepare'):
+      # pivots between the same two values of a branch keep the same events
+      classes = get_cut_classes(tree, supercuts)
+      logger.info("Collapsed {0:d} cuts into {1:d} distinct cuts".format(len(grid), int(get_n_classes(supercuts, classes))))
+      # the cuts only select events, so the weight is only computed once
+      eventWeights = get_event_weights(tree, eventWeightBranch, sample_scaleFactor if foldScaleFactor else None)
+
+  # build the containing canvas for all histograms drawn in `apply_selection`
+  canvas = None
+  if not doNumpy: canvas = ROOT.TCanvas('test{0:s}'.format(did), 'test{0:s}'.format(did), 200, 10, 100, 100)
+
+  # every engine fills in the counts for the cuts of the grid, in whatever order suits it best
+  counts = grid.get_counts()
+  # a background recorded as empty makes the cuts look more significant than they are
+  if prune_below is not None and signal_dids is not None and did not in signal_dids: prune_below = min(prune_below, 1)
+  if doNumpy and prune_below is not None:
+    # share the masks between cuts and skip the parts of the grid that are empty
+    from .scan import scan_cuts
+    results = scan_cuts(tree, grid, eventWeights, counts, prune_below, classes, sparse_below)
+  elif doNumpy:
+    from .scan import apply_cuts_once
+    from .jit import get_fused_cuts
+    # compile the selections into a single loop if numba is around
+    with timer.phase('compile'):
+      fused = get_fused_cuts(tree, grid, eventWeights) if doJIT else None
+    if fused is not None: logger.info("Applying the cuts with numba")
+    results = apply_cuts_once(tree, grid, eventWeights, classes, counts, fused)
+  else:
+    results = apply_grid(tree, grid, eventWeightBranch, counts, canvas)
+
+  with timer.phase('scan'):
+    with tqdm.tqdm(desc='Working on DID {0:s}'.format(did), total=len(grid), disable=(position==-1), position=position+1, leave=True, mininterval=5, maxinterval=10, unit='cuts', dynamic_ncols=True) as pbar:
+      for numCuts in results:
+        pbar.update(numCuts)
+        if metrics is not None: metrics.update(cuts=numCuts)
+  timer.count(cuts=len(grid))
+
+  with timer.phase('serialize'):
     cuts = {}
-    for cut in tqdm.tqdm(get_cut(copy.deepcopy(supercuts)), desc='Working on DID {0:s}'.format(did), total=get_n_cuts(supercuts), disable=(position==-1), position=position+1, leave=True, mininterval=5, maxinterval=10, unit='cuts', dynamic_ncols=True):
-      cut_hash = get_cut_hash(cut)
-      rawEvents, weightedEvents = apply_cuts(tree, cut, eventWeightBranch, doNumpy, canvas=canvas)
-      scaledEvents = weightedEvents*sample_scaleFactor
+    for cut_hash, (rawEvents, weightedEvents, pruned) in zip(grid.iter_hashes(), counts.tolist()):
+      if foldScaleFactor:
+        # the engines already gave back the scaled counts
+        scaledEvents, weightedEvents = weightedEvents, weightedEvents/sample_scaleFactor
+      else:
+        scaledEvents = weightedEvents*sample_scaleFactor
       cuts[cut_hash] = {'raw': rawEvents, 'weighted': weightedEvents, 'scaled': scaledEvents}
-    logger.info("Applied {0:d} cuts".format(len(cuts)))
-    with open('{0:s}/{1:s}.json'.format(output_directory, did), 'w+') as f:
+    with open(get_shard_filename(output_directory, did, shard), 'w+') as f:
       f.write(json.dumps(cuts, sort_keys=True, indent=4))
-      result = True
-    del canvas
+  numPruned = int(np.count_nonzero(counts['pruned']))
+  timer.count(pruned=numPruned)
+  logger.info("Applied {0:d} cuts".format(len(cuts)))
+  if numPruned:
+    logger.info("\tPruned {0:d} cuts ({1:0.2%}) without evaluating them".format(numPruned, float(numPruned)/len(cuts)))
+  del canvas
+
+def get_shard_filename(output_directory, did, shard=None):
+  ''' where the counts of a DID go, the shards of a DID are not .json files until `merge_shards` puts them together '''
+  if shard is None: return '{0:s}/{1:s}.json'.format(output_directory, did)
+  return '{0:s}/{1:s}.json.{2:d}-{3:d}'.format(output_directory, did, shard[0], shard[1])
+
+def get_job_name(did, shard=None):
+  ''' how a job is called in the logs and the metrics '''
+  if shard is None: return did
+  return '{0:s}.{1:d}-{2:d}'.format(did, shard[0], shard[1])
+
+def get_profile_filename(profile_directory, did, shard=None):
+  ''' where the profile of a job goes, None if it is not profiled '''
+  if profile_directory is None: return None
+  if shard is None: return os.path.join(profile_directory, '{0:s}.prof'.format(did))
+  return os.path.join(profile_directory, '{0:s}.{1:d}-{2:d}.prof'.format(did, shard[0], shard[1]))
+
+#@echo(write=logger.debug)
+def merge_shards(output_directory, did, shards):
+  ''' combine the counts written out for each shard of a DID into the one file of the DID, and remove the shards '''
+  cuts = {}
+  for shard in shards:
+    with open(get_shard_filename(output_directory, did, shard), 'r') as f:
+      cuts.update(json.load(f))
+  with open(get_shard_filename(output_directory, did), 'w+') as f:
+    f.write(json.dumps(cuts, sort_keys=True, indent=4))
+  for shard in shards:
+    os.remove(get_shard_filename(output_directory, did, shard))
+
+#@echo(write=logger.debug)
+def do_cut(did, files, supercuts, weights, tree_name, output_directory, eventWeightBranch, doNumpy, pids, prune_below=None, sparse_below=0.05, doJIT=True, foldScaleFactor=False, downcast=False, shard=None, shared=None, profile=None, metrics=None, governor=None, signal_dids=None, index=None, numexpr_threads=None):
+  ''' Read in a DID and apply the cuts to it, returns whether it worked and the `timing.Timer` of the job
+        - with profile (a directory), the job runs under cProfile and dumps its statistics there
+        - with metrics (a `metrics.Reporter`), the progress of the job is sent to the parent as it goes
+        - with governor (a `MemoryGovernor`), the job waits until its memory fits before it reads anything in
+        - index and numexpr_threads are passed on to `setup_worker`
+  '''
+  setup_worker(index, numexpr_threads)
+  position = get_position(pids)
+  timer = timing.Timer(did)
+  if governor is not None: governor.acquire(get_job_name(did, shard))
+  if metrics is not None: metrics.start(get_job_name(did, shard))
+  try:
+    with timing.profile(get_profile_filename(profile, did, shard)):
+      if shared is None:
+        tree = load_did(did, files, supercuts, tree_name, eventWeightBranch, doNumpy, downcast, timer)
+      else:
+        tree = shared.get(did, lambda: load_did(did, files, supercuts, tree_name, eventWeightBranch, doNumpy, downcast, timer))
+      if metrics is not None: metrics.update(events=timer.counts['events'])
+      cut_did(did, tree, supercuts, weights, output_directory, eventWeightBranch, doNumpy, position, prune_below, sparse_below, doJIT, foldScaleFactor, shard, timer, metrics, signal_dids)
+    result = True
   except:
     logger.exception("Caught an error - skipping {0:s}".format(did))
     result = False
-  end = clock()
-  return (result, end-start)
+  if governor is not None: governor.release(get_job_name(did, shard))
+  if metrics is not None: metrics.done(get_job_name(did, shard), result)
+  return (result, timer)
+
+#@echo(write=logger.debug)
+def prefetch(load, items):
+  ''' Call load(item) for every item on a background thread, staying one item ahead of the caller
+        - yields (item, loaded, error) in order, error is the formatted traceback if load raised
+        - the next item is only loaded once the caller took the previous one, so at most one loaded
+          item is ever waiting on the caller
+  '''
+  slots = threading.Semaphore(1)
+  loaded = queue.Queue()
+  def producer():
+    for item in items:
+      slots.acquire()
+      try:
+        loaded.put((item, load(item), None))
+      except Exception:
+        loaded.put((item, None, traceback.format_exc()))
+  thread = threading.Thread(target=producer)
+  thread.daemon = True
+  thread.start()
+  for i in range(len(items)):
+    item, result, error = loaded.get()
+    slots.release()
+    yield item, result, error
+    # let go of this one before waiting on the next
+    result = None
+
+#@echo(write=logger.debug)
+def do_cut_prefetched(jobs, supercuts, weights, tree_name, output_directory, eventWeightBranch, doNumpy, pids, prune_below=None, sparse_below=0.05, doJIT=True, foldScaleFactor=False, downcast=False, shared=None, metrics=None, governor=None, signal_dids=None, index=None, numexpr_threads=None):
+  ''' Same as `do_cut`, but over a list of jobs (did, files, shard): the next DID is read in on a background thread
+      while the current one is being cut, so ROOT I/O and the cuts overlap
+        - returns the (result, timer) of every job in the same order
+  '''
+  setup_worker(index, numexpr_threads)
+  position = get_position(pids)
+  # ROOT is only used from the background thread while the cuts run, but make sure it knows about threads
+  enable_thread_safety()
+
+  # every job has its own timer, the phases of the background thread go to it as well
+  timers = [timing.Timer(job[0]) for job in jobs]
+  def load(index):
+    did, files, shard = jobs[index]
+    # the job that is being cut keeps its memory, so this waits for enough of it next to that one
+    if governor is not None: governor.acquire(get_job_name(did, shard))
+    if shared is None:
+      tree = load_did(did, files, supercuts, tree_name, eventWeightBranch, doNumpy, downcast, timers[index])
+    else:
+      tree = shared.get(did, lambda: load_did(did, files, supercuts, tree_name, eventWeightBranch, doNumpy, downcast, timers[index]))
+    if metrics is not None: metrics.update(events=timers[index].counts['events'])
+    return tree
+
+  results = []
+  for index, tree, error in prefetch(load, list(range(len(jobs)))):
+    did, files, shard = jobs[index]
+    if metrics is not None: metrics.start(get_job_name(did, shard))
+    result = False
+    if error is not None:
+      logger.error("Caught an error - skipping {0:s}\n{1:s}".format(did, error))
+    else:
+      try:
+        cut_did(did, tree, supercuts, weights, output_directory, eventWeightBranch, doNumpy, position, prune_below, sparse_below, doJIT, foldScaleFactor, shard, timers[index], metrics, signal_dids)
+        result = True
+      except:
+        logger.exception("Caught an error - skipping {0:s}".format(did))
+      del tree
+    if governor is not None: governor.release(get_job_name(did, shard))
+    if metrics is not None: metrics.done(get_job_name(did, shard), result)
+    results.append((result, timers[index]))
+  return results
 
 def get_summary(filename, mass_windows, stop_masses=[]):
   ''' Primarily used from within do_summary
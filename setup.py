@@ -6,8 +6,8 @@ if sys.version_info < (2, 6):
     sys.exit("root_optimize only supports python 2.6 and above")
 
 # do the setup
+import re
 from setuptools import setup
-from root_optimize import __version__
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -21,6 +21,8 @@ def read(*filenames, **kwargs):
     return sep.join(buf)
 
 long_description = read(os.path.join(here, 'README.rst'))
+# read the version without importing the package (and all of its dependencies)
+__version__ = re.search(r"^__version__ = '([^']*)'", read(os.path.join(here, 'root_optimize', '__init__.py')), re.M).group(1)
 
 setup(
     name='root_optimize',
@@ -30,6 +32,16 @@ setup(
     author_email='kratsg@gmail.com',
     url='https://github.com/kratsg/Optimization',
     packages=['root_optimize'],
+    # the standalone tools, so they can be run from an installed copy without the repository
+    scripts=['add-cuts.py',
+             'do_n-1_cuts.py',
+             'find_optimal_control_region.py',
+             'find_optimal_signal_region.py',
+             'graph-cuts.py',
+             'graph-grid.py',
+             'summary-comparison.py',
+             'tableOfBackgrounds.py',
+             'write_optimal_signal_region_summary.py'],
     license='MIT',
     classifiers=[
         'Intended Audience :: Developers',
@@ -62,6 +74,10 @@ setup(
       'rootpy~=0.9',
       'tqdm~=4.11'
     ],
+    extras_require={
+      'jit': ['numba'],
+      'scipy': ['scipy']
+    },
     entry_points = {
       'console_scripts': ['rooptimize=root_optimize.command_line:main']
     }
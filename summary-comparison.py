@@ -1,3 +1,4 @@
+#!/usr/bin/env python
 import os
 import csv
 import json
@@ -140,13 +141,11 @@ def exclusion():
 if __name__ == '__main__':
 
   import argparse
-  import subprocess
 
   class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
     pass
 
-  __version__ = subprocess.check_output(["git", "describe", "--always"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
-  __short_hash__ = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+  from root_optimize import __version__
 
   parser = argparse.ArgumentParser(description='Author: N. Harrison, G. Stark. v.{0}'.format(__version__),
                                    formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
@@ -1,3 +1,4 @@
+#!/usr/bin/env python
 import json
 import glob
 import os
@@ -6,15 +7,13 @@ import copy
 import numpy
 
 import argparse
-import subprocess
 import os
 from root_optimize import utils
 
 class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
   pass
 
-__version__ = subprocess.check_output(["git", "describe", "--always"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
-__short_hash__ = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__))).strip()
+from root_optimize import __version__
 
 parser = argparse.ArgumentParser(description='Author: G. Stark. v.{0}'.format(__version__), formatter_class=lambda prog: CustomFormatter(prog, max_help_position=30))
 parser.add_argument('--regions', type=str, metavar='<regions.json>', required=True, help='JSON file defining the regions and paths to the cuts to look at')
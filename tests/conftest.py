@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import copy
+
+import numpy as np
+import pytest
+
+from root_optimize import utils
+
+def make_events(numEvents, seed=0, scale=100.):
+  ''' a seeded array like the one `utils.load_did` reads in, with an integer multiplicity and a few NaNs '''
+  rng = np.random.RandomState(seed)
+  arr = np.zeros(numEvents, dtype=[('event_weight', 'f8'), ('met', 'f8'), ('mj', 'i4'), ('meff', 'f8')])
+  arr['event_weight'] = rng.exponential(1., numEvents)
+  # some events do not count at all
+  arr['event_weight'][::17] = 0.
+  arr['met'] = rng.exponential(scale, numEvents)
+  arr['mj'] = rng.poisson(4, numEvents)
+  arr['meff'] = rng.exponential(4*scale, numEvents)
+  arr['meff'][::13] = np.nan
+  return arr
+
+@pytest.fixture(scope='session')
+def events():
+  return make_events(5000)
+
+@pytest.fixture(scope='session')
+def supercuts():
+  ''' a threshold both ways, a scaled threshold, a window and a fixed cut '''
+  return [{'selections': 'met > {0}', 'st3': [[0, 400, 100]]},
+          {'selections': 'mj < {0}', 'st3': [[9, 2, -2]]},
+          {'selections': 'meff/1000 > {0}', 'st3': [[0, 1.2, 0.4]]},
+          {'selections': 'mj >= {0}', 'pivot': [2]},
+          {'selections': '(meff > {0}) & (meff < {1})', 'st3': [[0, 1000, 250], [500, 2500, 500]]}]
+
+def get_reference(arr, supercuts):
+  ''' the (raw, weighted) counts of every cut, applied one at a time with `utils.apply_cuts` '''
+  return np.array([utils.apply_cuts(arr, cut, 'event_weight', doNumpy=True) for cut in utils.get_cut(copy.deepcopy(supercuts))])
+
+@pytest.fixture(scope='session')
+def reference(events, supercuts):
+  return get_reference(events, supercuts)
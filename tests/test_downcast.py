@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import numpy as np
+import pytest
+
+from root_optimize import scan, utils
+from root_optimize.grid import CutGrid
+
+from conftest import get_reference
+
+def get_counts(arr, supercuts):
+  grid = CutGrid(supercuts)
+  counts = grid.get_counts()
+  for numCuts in scan.apply_cuts_once(arr, grid, utils.get_event_weights(arr, 'event_weight'), scan.get_cut_classes(arr, supercuts), counts): pass
+  return counts
+
+@pytest.fixture
+def exact(events):
+  ''' the events with every double exact in float32 '''
+  arr = events.copy()
+  for branch in ['event_weight', 'met', 'meff']: arr[branch] = arr[branch].astype(np.float32)
+  return arr
+
+def test_thresholds(events, supercuts, reference):
+  ''' the branches only used in thresholds and windows are narrowed, and none of the counts change '''
+  supercuts = [supercut for supercut in supercuts if supercut['selections'] != 'meff/1000 > {0}']
+  downcast = utils.downcast_branches(events, supercuts, 'event_weight')
+  assert downcast.dtype['mj'] == np.uint8
+  assert downcast.dtype['met'] == np.float32
+  assert downcast.dtype['event_weight'] == np.float64
+  counts = get_counts(downcast, supercuts)
+  expected = get_reference(events, supercuts)
+  assert np.array_equal(counts['raw'], expected[:, 0])
+  assert np.array_equal(counts['weighted'], expected[:, 1])
+
+def test_arithmetic(exact):
+  ''' float32 arithmetic rounds differently, so a branch used in arithmetic is kept even if every value is exact '''
+  supercuts = [{'selections': 'met/1000 > {0}', 'st3': [[0, 0.5, 0.01]]},
+               {'selections': '(meff*1.1 > {0}) & (mj > 1)', 'st3': [[0, 2000, 97.3]]}]
+  downcast = utils.downcast_branches(exact, supercuts, 'event_weight')
+  assert downcast.dtype['met'] == np.float64
+  assert downcast.dtype['meff'] == np.float64
+  counts = get_counts(downcast, supercuts)
+  expected = get_reference(exact, supercuts)
+  assert np.array_equal(counts['raw'], expected[:, 0])
+  assert np.array_equal(counts['weighted'], expected[:, 1])
+
+def test_event_weight(exact):
+  ''' the event weight is summed, so it is never rounded, even if it is an expression '''
+  supercuts = [{'selections': 'mj > {0}', 'st3': [[0, 5, 1]]}]
+  assert utils.downcast_branches(exact, supercuts, 'event_weight').dtype['event_weight'] == np.float64
+  assert utils.downcast_branches(exact, supercuts, 'event_weight*met').dtype['met'] == np.float64
+  assert utils.downcast_branches(exact, supercuts, 'event_weight*met').dtype['meff'] == np.float32
+
+def test_get_narrowest_dtype():
+  assert utils.get_narrowest_dtype(np.array([0, 4, 12], dtype=np.int64), []) == np.uint8
+  assert utils.get_narrowest_dtype(np.array([0, 400], dtype=np.int32)) == np.uint16
+  # used in arithmetic, which numexpr would do in 32 bits
+  assert utils.get_narrowest_dtype(np.array([0, 4], dtype=np.int64)) == np.int64
+  assert utils.get_narrowest_dtype(np.array([0.5, 1.25])) == np.float64
+  assert utils.get_narrowest_dtype(np.array([0.5, 1.25]), []) == np.float32
+  # 0.1 rounds to just above 0.1 in float32
+  assert utils.get_narrowest_dtype(np.array([0.1]), [0.1]) == np.float64
+  assert utils.get_narrowest_dtype(np.array([0.1]), [0.5]) == np.float32
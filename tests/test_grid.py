@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import copy
+
+import numpy as np
+import pytest
+
+from root_optimize import utils
+from root_optimize.grid import CutGrid
+
+def get_hashes(supercuts):
+  ''' the hash of every cut, the way the cuts were made before the grid '''
+  return [utils.get_cut_hash(cut) for cut in utils.get_cut(copy.deepcopy(supercuts))]
+
+def test_len(supercuts):
+  assert len(CutGrid(supercuts)) == utils.get_n_cuts(supercuts) == len(get_hashes(supercuts))
+
+@pytest.mark.parametrize('block_size', [1, 100, 1 << 16])
+def test_hashes(supercuts, block_size):
+  assert list(CutGrid(supercuts).iter_hashes(block_size=block_size)) == get_hashes(supercuts)
+
+def test_cuts(supercuts):
+  grid = CutGrid(supercuts)
+  assert [utils.get_cut_hash(cut) for cut in grid.iter_cuts()] == get_hashes(supercuts)
+  hashes = get_hashes(supercuts)
+  for index in [0, 1, len(grid)//3, len(grid)-1]:
+    assert utils.get_cut_hash(grid.get_cut(index)) == grid.get_hash(index) == hashes[index]
+  # the hashes of some of the cuts, in any order
+  indices = np.array([len(grid)-1, 0, 5])
+  assert list(grid.iter_hashes(indices)) == [hashes[index] for index in indices.tolist()]
+
+def test_fixed_only():
+  supercuts = [{'selections': 'met > {0}', 'pivot': [100]}, {'selections': 'mj >= {0}', 'pivot': [4]}]
+  grid = CutGrid(supercuts)
+  assert len(grid) == 1
+  assert list(grid.iter_hashes()) == get_hashes(supercuts)
+
+@pytest.mark.parametrize('numShards', [1, 3, 10])
+def test_shards(supercuts, numShards):
+  grid = CutGrid(supercuts)
+  shards = grid.split(numShards)
+  assert sum(len(shard) for shard in shards) == len(grid)
+  assert sum((list(shard.iter_hashes(block_size=7)) for shard in shards), []) == get_hashes(supercuts)
+  assert [utils.get_cut_hash(cut) for shard in shards for cut in shard.iter_cuts()] == get_hashes(supercuts)
+
+def test_index(supercuts):
+  grid = CutGrid(supercuts)
+  indices = np.arange(len(grid))
+  assert np.array_equal(grid.get_index(grid.get_pivots(indices)), indices)
+  # indices are relative to the start of a shard
+  shard = grid[10:20]
+  assert np.array_equal(shard.get_index(shard.get_pivots(np.arange(10))), np.arange(10))
+  assert shard.get_index(grid.get_pivots(15)) == 5
+  with pytest.raises(KeyError):
+    shard.get_index(grid.get_pivots(25))
+  with pytest.raises(KeyError):
+    grid.get_index([[1e9]] + grid.get_pivots([0])[1:])
+
+def test_slice(supercuts):
+  grid = CutGrid(supercuts)
+  with pytest.raises(ValueError):
+    grid[::2]
+  assert len(grid[5:5]) == 0
+  assert len(grid[-10:]) == 10
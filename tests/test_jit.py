@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import numpy as np
+import pytest
+
+from root_optimize import scan, utils
+from root_optimize.grid import CutGrid
+from root_optimize.jit import get_fused_cuts, numba
+
+from conftest import get_reference, make_events
+
+pytestmark = pytest.mark.skipif(numba is None, reason='numba is not installed')
+
+def apply_fused(arr, supercuts):
+  ''' the counts of every cut from the cut engine with numba, and whether numba was used '''
+  grid = CutGrid(supercuts)
+  weights = utils.get_event_weights(arr, 'event_weight')
+  fused = get_fused_cuts(arr, grid, weights)
+  counts = grid.get_counts()
+  for numCuts in scan.apply_cuts_once(arr, grid, weights, scan.get_cut_classes(arr, supercuts), counts, fused): pass
+  return counts, fused is not None
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('selection', ['met/1000 > {0}', '(met - 10)*0.001 < {0}'])
+def test_arithmetic(selection, dtype):
+  ''' numexpr does arithmetic on float32 in single precision, numba in double precision '''
+  events = make_events(20000, seed=3)
+  arr = events.astype([(name, dtype if name == 'met' else events.dtype[name]) for name in events.dtype.names])
+  # fine enough that some pivots fall between the float32 and the float64 quotient of an event
+  supercuts = [{'selections': selection, 'st3': [[0, 0.5, 0.0001]]}]
+  counts, fused = apply_fused(arr, supercuts)
+  # numba is only trusted with the arithmetic it does in the same precision
+  assert fused == (dtype == np.float64)
+  reference = get_reference(arr, supercuts)
+  assert np.array_equal(counts['raw'], reference[:, 0])
+  assert np.array_equal(counts['weighted'], reference[:, 1])
+
+def test_comparisons(supercuts):
+  ''' branches of any type can be compared without arithmetic '''
+  arr = make_events(5000, seed=4)
+  arr = arr.astype([('event_weight', 'f8'), ('met', 'f4'), ('mj', 'i1'), ('meff', 'f8')])
+  counts, fused = apply_fused(arr, supercuts)
+  assert fused
+  reference = get_reference(arr, supercuts)
+  assert np.array_equal(counts['raw'], reference[:, 0])
+  assert np.array_equal(counts['weighted'], reference[:, 1])
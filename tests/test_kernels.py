@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import numexpr as ne
+import numpy as np
+import pytest
+
+from root_optimize import kernels
+
+def count_each(arr, weights, selection, pivots):
+  ''' the raw and weighted counts of every pivot, one pivot at a time '''
+  counts = []
+  for pivot in pivots:
+    passed = ne.evaluate(selection.format(*pivot), local_dict=arr)
+    counts.append((np.count_nonzero(passed), np.sum(weights[passed])))
+  return np.array(counts)
+
+@pytest.mark.parametrize('tile_size', [1, 7, 1000, kernels.tile_size])
+@pytest.mark.parametrize('selection, pivots', [
+  ('met > {0}', [(0,), (50.5,), (100,), (1e9,)]),
+  ('abs(met - {0}) < 20', [(10,), (100,), (300,)]),
+  ('(meff > {0}) & (meff < {1}) & (mj >= 4)', [(0, 500), (250, 2000), (500, 250)])])
+def test_count_pivots(events, selection, pivots, tile_size):
+  weights = events['event_weight']
+  columns = dict((branch, events[branch]) for branch in ['met', 'mj', 'meff'])
+  rawEvents, weightedEvents = kernels.count_pivots(columns, weights, {'selections': selection}, pivots, tile_size)
+  reference = count_each(events, weights, selection, pivots)
+  assert rawEvents.tolist() == reference[:, 0].tolist()
+  np.testing.assert_allclose(weightedEvents, reference[:, 1], rtol=1e-12)
+
+@pytest.mark.parametrize('lower, upper, selection', [
+  (('>', 0), None, 'meff > {0}'),
+  (('>=', 0), None, 'meff >= {0}'),
+  (None, ('<', 0), 'meff < {0}'),
+  (None, ('<=', 0), 'meff <= {0}'),
+  (('>', 0), ('<=', 1), '(meff > {0}) & (meff <= {1})')])
+def test_count_sorted(events, lower, upper, selection):
+  weights = events['event_weight']
+  # pivots right on some of the values, and windows that are empty
+  pivots = [(0, 1000), (events['meff'][1], events['meff'][2]), (800, 100), (1e9, 2e9)]
+  rawEvents, weightedEvents = kernels.count_sorted(events['meff'], weights, lower, upper, pivots)
+  reference = count_each(events, weights, selection, pivots)
+  assert rawEvents.tolist() == reference[:, 0].tolist()
+  np.testing.assert_allclose(weightedEvents, reference[:, 1], rtol=1e-12, atol=1e-9)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from root_optimize import scan, utils
+from root_optimize.grid import CutGrid
+from root_optimize.jit import get_fused_cuts
+
+def check_counts(counts, reference):
+  ''' the raw counts are exact, the weighted counts are only summed in a different order '''
+  assert np.array_equal(counts['raw'], reference[:, 0])
+  np.testing.assert_allclose(counts['weighted'], reference[:, 1], rtol=1e-12, atol=1e-9)
+
+def run(results):
+  return sum(results)
+
+@pytest.mark.parametrize('use_classes', [False, True])
+def test_scan_cuts(events, supercuts, reference, use_classes):
+  grid = CutGrid(supercuts)
+  classes = scan.get_cut_classes(events, supercuts) if use_classes else None
+  counts = grid.get_counts()
+  assert run(scan.scan_cuts(events, grid, utils.get_event_weights(events, 'event_weight'), counts, 1, classes)) == len(grid)
+  check_counts(counts, reference)
+
+def test_scan_cuts_sparse(events, supercuts, reference):
+  # every prefix switches to the indices of the events it keeps right away
+  grid = CutGrid(supercuts)
+  counts = grid.get_counts()
+  run(scan.scan_cuts(events, grid, utils.get_event_weights(events, 'event_weight'), counts, 1, None, sparse_below=1.))
+  check_counts(counts, reference)
+
+@pytest.mark.parametrize('use_jit', [False, True])
+def test_apply_cuts_once(events, supercuts, reference, use_jit):
+  grid = CutGrid(supercuts)
+  weights = utils.get_event_weights(events, 'event_weight')
+  fused = get_fused_cuts(events, grid, weights) if use_jit else None
+  if use_jit and fused is None: pytest.skip('numba is not installed')
+  counts = grid.get_counts()
+  run(scan.apply_cuts_once(events, grid, weights, scan.get_cut_classes(events, supercuts), counts, fused))
+  # both sum the same compacted weights
+  assert np.array_equal(counts['raw'], reference[:, 0])
+  np.testing.assert_allclose(counts['weighted'], reference[:, 1], rtol=1e-12)
+
+@pytest.mark.parametrize('numShards', [2, 7])
+def test_shards(events, supercuts, reference, numShards):
+  grid = CutGrid(supercuts)
+  classes = scan.get_cut_classes(events, supercuts)
+  weights = utils.get_event_weights(events, 'event_weight')
+  for engine in ['scan', 'once']:
+    shards = []
+    for shard in grid.split(numShards):
+      counts = shard.get_counts()
+      if engine == 'scan':
+        numCuts = run(scan.scan_cuts(events, shard, weights, counts, 1, classes))
+      else:
+        numCuts = run(scan.apply_cuts_once(events, shard, weights, classes, counts))
+      assert numCuts == len(shard)
+      shards.append(counts)
+    check_counts(np.concatenate(shards), reference)
+
+def test_prune_below(events, supercuts, reference):
+  grid = CutGrid(supercuts)
+  counts = grid.get_counts()
+  run(scan.scan_cuts(events, grid, utils.get_event_weights(events, 'event_weight'), counts, 50))
+  assert counts['pruned'].any()
+  # only cuts keeping fewer raw events than that are recorded as empty, the rest are exact
+  assert np.all(reference[counts['pruned'], 0] < 50)
+  assert np.all(counts['raw'][counts['pruned']] == 0)
+  check_counts(counts[~counts['pruned']], reference[~counts['pruned']])
+
+def test_prune_below_signal_only(events, supercuts, reference, tmpdir):
+  ''' a DID that is not one of the signal DIDs is only pruned where a cut is empty '''
+  for did in ['signal', 'background']:
+    utils.cut_did(did, events, supercuts, {}, str(tmpdir), 'event_weight', True, prune_below=50, signal_dids=['signal'])
+  with open(os.path.join(str(tmpdir), 'background.json')) as f:
+    background = json.load(f)
+  with open(os.path.join(str(tmpdir), 'signal.json')) as f:
+    signal = json.load(f)
+  hashes = list(CutGrid(supercuts).iter_hashes())
+  assert [background[cut_hash]['raw'] for cut_hash in hashes] == reference[:, 0].tolist()
+  assert sum(signal[cut_hash]['raw'] for cut_hash in hashes) < reference[:, 0].sum()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import math
+import operator
+from collections import OrderedDict
+
+import pytest
+
+from root_optimize import scan, utils
+from root_optimize.grid import CutGrid
+from root_optimize.search import find_top_cuts
+
+from conftest import make_events
+
+def get_counts(arr, supercuts):
+  ''' the counts of every cut by hash, in the order of the grid like the output of cut '''
+  grid = CutGrid(supercuts)
+  counts = grid.get_counts()
+  for numCuts in scan.apply_cuts_once(arr, grid, utils.get_event_weights(arr, 'event_weight'), scan.get_cut_classes(arr, supercuts), counts): pass
+  return OrderedDict((cut_hash, {'raw': raw, 'weighted': weighted, 'scaled': weighted*0.1}) for cut_hash, (raw, weighted, pruned) in zip(grid.iter_hashes(), counts.tolist()))
+
+def get_significance(signal, bkgd):
+  return signal/math.sqrt(1. + bkgd + (0.3*bkgd)**2)
+
+@pytest.fixture(scope='module')
+def samples(supercuts):
+  ''' the counts of a signal (harder met) and a background sample '''
+  return get_counts(make_events(2000, seed=1, scale=300.), supercuts), get_counts(make_events(20000, seed=2), supercuts)
+
+@pytest.mark.parametrize('k', [1, 10, 50, 1000])
+def test_find_top_cuts(supercuts, samples, k):
+  signal_data, total_bkgd = samples
+  get_sig_dict = lambda cut_hash, counts: {'hash': cut_hash, 'significance_scaled': get_significance(counts['scaled'], total_bkgd[cut_hash]['scaled'])}
+  get_upper_bound = lambda sig_counts, bkgd_counts: get_significance(sig_counts['scaled'], bkgd_counts['scaled'])
+
+  exhaustive = sorted((get_sig_dict(cut_hash, counts) for cut_hash, counts in signal_data.items()), key=operator.itemgetter('significance_scaled'), reverse=True)[:k]
+  top = find_top_cuts(supercuts, signal_data, total_bkgd, get_upper_bound, get_sig_dict, k)
+  # the ties are broken the same way, so the hashes come out in the same order
+  assert [sig_dict['hash'] for sig_dict in top] == [sig_dict['hash'] for sig_dict in exhaustive]
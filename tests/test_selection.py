@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-,
+
+
+
+import numexpr as ne
+import numpy as np
+import pytest
+
+from root_optimize import utils
+from root_optimize.selection import Selection, get_branches
+
+@pytest.mark.parametrize('selection, branches, directions', [
+  ('met > {0}', ['met'], [1]),
+  ('met >= {0}', ['met'], [1]),
+  ('met < {0}', ['met'], [-1]),
+  ('{0} < met', ['met'], [1]),
+  ('met/1000 > {0}', ['met'], [1]),
+  ('-met > {0}', ['met'], [1]),
+  ('met < -{0}', ['met'], [1]),
+  ('met*-2 > {0}', ['met'], [1]),
+  ('sqrt(met) > {0}', ['met'], [1]),
+  ('(met > {0}) & (mj >= 4)', ['met', 'mj'], [1]),
+  ('(met > {0}) && (mj >= 4)', ['met', 'mj'], [1]),
+  ('(met > {0}) || (mj > 3)', ['met', 'mj'], [1]),
+  ('!(met < {0})', ['met'], [1]),
+  ('~(met > {0})', ['met'], [-1]),
+  ('(meff > {0}) & (meff < {1})', ['meff'], [1, -1]),
+  ('{0} < meff < {1}', ['meff'], [1, -1]),
+  ('abs(met - {0}) < 10', ['met'], [0]),
+  ('met > {}', ['met'], [1]),
+  ('jet_pt[0] > {0}', ['jet_pt'], [1]),
+  ('mj > 4', ['mj'], [])])
+def test_selection(selection, branches, directions):
+  parsed = Selection(selection)
+  assert parsed.branches == branches
+  assert parsed.directions == directions
+  assert parsed.numPivots == len(directions)
+
+@pytest.mark.parametrize('selection', ['met > {0}', 'met < {0}', 'met/1000 > {0}', '-met > {0}', '(met > {0}) & (mj >= 4)',
+                                       '(met > {0}) | (mj > 6)', '~(met < {0})', 'sqrt(met) > {0}', 'met*-2 > {0}'])
+def test_direction(events, selection):
+  ''' the cut keeps fewer events as the pivot moves the way it tightens '''
+  direction = Selection(selection).directions[0]
+  counts = [np.count_nonzero(ne.evaluate(selection.format(pivot), local_dict=events)) for pivot in np.linspace(-400, 400, 41)*direction]
+  assert all(np.diff(counts) <= 0)
+
+@pytest.mark.parametrize('selection, expected', [
+  ('(met > {0}) && (mj >= 4)', '(met > {0}) & (mj >= 4)'),
+  ('!(met < {0}) || (mj == 2)', '~(met < {0}) | (mj == 2)'),
+  ('{0} < meff < {1}', '({0} < meff) & (meff < {1})'),
+  ('abs(met - {0}) < 10', 'abs(met - {0}) < 10'),
+  ('met**2 > {0}', 'met**2 > {0}')])
+def test_to_numexpr(events, selection, expected):
+  ''' writing the selection back out keeps the same events '''
+  pivots = [100, 300]
+  assert np.array_equal(ne.evaluate(Selection(selection).to_numexpr().format(*pivots), local_dict=events),
+                        ne.evaluate(expected.format(*pivots), local_dict=events))
+
+def test_to_cpp():
+  assert Selection('(met > {0}) & (mj >= 4)').to_cpp() == '((met > {0}) && (mj >= 4))'
+  assert Selection('~(met < {0}) | (mj == 2)').to_cpp() == '((!(met < {0})) || (mj == 2))'
+  assert Selection('abs(met - {0}) < 10').to_cpp() == '(std::abs((met - {0})) < 10)'
+  assert Selection('met**2 > {0}').to_cpp() == '(pow(met, 2) > {0})'
+
+def test_get_branches():
+  supercuts = [{'selections': 'met/1000 > {0}'}, {'selections': '(meff > {0}) & (met < {1})'}]
+  assert get_branches(supercuts, 'weight_mc*weight_pu') == ['met', 'meff', 'weight_mc', 'weight_pu']
+  with pytest.raises(SyntaxError):
+    get_branches([{'selections': 'Sum$(jet_pt > {0}) > 2'}])
+
+@pytest.mark.parametrize('selection, threshold, direction', [
+  ('met > {0}', ('met', '>'), 1),
+  ('{0} <= met', ('met', '>='), 1),
+  ('met/1000 < {0}', ('met/1000', '<'), -1),
+  ('met > {1}', None, 0),
+  ('abs(met - {0}) < 10', None, 0),
+  ('(met > {0}) & (met < {1})', None, 0)])
+def test_get_threshold(selection, threshold, direction):
+  assert utils.get_threshold(selection) == threshold
+  assert utils.selection_direction(selection) == direction
+
+@pytest.mark.parametrize('selection, window', [
+  ('(met > {0}) & (met < {1})', ('met', ('>', 0), ('<', 1))),
+  ('(met <= {1}) & (met >= {0})', ('met', ('>=', 0), ('<=', 1))),
+  ('({0} < met) & (met < {1})', ('met', ('>', 0), ('<', 1))),
+  ('(met > {0}) & (meff < {1})', None),
+  ('(met > {0}) & (met < {0})', None),
+  ('(met > {0}) | (met < {1})', None),
+  ('met > {0}', None)])
+def test_get_window(selection, window):
+  assert utils.get_window(selection) == window